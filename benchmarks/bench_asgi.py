@@ -0,0 +1,113 @@
+"""
+Concurrency of the WSGI app (sync worker, and threads like gunicorn
+--threads, also as many threads as the ASGI concurrency) against the ASGI
+entry point, with a simulated database latency added to every SQL
+statement.
+
+    $ pipenv run python benchmarks/bench_asgi.py --latency 20 --requests 200 --concurrency 50
+"""
+import os
+import sys
+import time
+import sqlite3
+import asyncio
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+DB_FILE = os.path.join(tempfile.mkdtemp(), "bench_asgi.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_FILE}"
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from sqlalchemy import event
+from app import app
+from models import db, Planet
+import asgi
+
+LATENCY = 0.0
+
+class SlowCursor(sqlite3.Cursor):
+    def execute(self, *args, **kwargs):
+        time.sleep(LATENCY)
+        return super().execute(*args, **kwargs)
+
+class SlowConnection(sqlite3.Connection):
+    def cursor(self, factory=SlowCursor):
+        return super().cursor(factory)
+
+def add_latency(engine):
+    # Both pysqlite and aiosqlite pass the extra arguments to sqlite3.connect,
+    # so the sleep happens in the thread that really runs the query
+    @event.listens_for(engine, "do_connect")
+    def use_slow_connection(dialect, connection_record, cargs, cparams):
+        cparams["factory"] = SlowConnection
+        cparams["check_same_thread"] = False
+
+def seed(rows):
+    with app.app_context():
+        db.create_all()
+        db.session.execute(Planet.__table__.insert(), [
+            {"name": f"planet-{i}", "density": 1, "diameter": 1, "orbital_period": 1, "population": i, "weater": "arid"}
+            for i in range(rows)
+        ])
+        db.session.commit()
+        add_latency(db.engine)
+    add_latency(asgi.engine.sync_engine)
+
+def run_wsgi(requests, threads):
+    client = app.test_client()
+
+    def get(i):
+        assert client.get(f"/planets?limit=20&after={cursor(i)}").status_code == 200
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(get, range(requests)))
+    return requests / (time.perf_counter() - start)
+
+async def run_asgi(requests, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def get(i):
+        async with semaphore:
+            messages = []
+
+            async def receive():
+                return {"type": "http.request", "body": b"", "more_body": False}
+
+            async def send(message):
+                messages.append(message)
+
+            scope = {"type": "http", "method": "GET", "path": "/planets", "headers": [],
+                     "query_string": f"limit=20&after={cursor(i)}".encode()}
+            await asgi.application(scope, receive, send)
+            assert messages[0]["status"] == 200
+
+    start = time.perf_counter()
+    await asyncio.gather(*[get(i) for i in range(requests)])
+    return requests / (time.perf_counter() - start)
+
+def cursor(i):
+    from utils import encode_cursor
+    return encode_cursor(["id", i, i])
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=20, help="milliseconds added to each SQL statement")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+
+    seed(1000)
+    LATENCY = args.latency / 1000
+    sync = run_wsgi(args.requests, 1)
+    threaded = run_wsgi(args.requests, 4)
+    # Same concurrency as the ASGI run
+    many_threads = run_wsgi(args.requests, args.concurrency)
+    async_ = asyncio.run(run_asgi(args.requests, args.concurrency))
+    print(f"latency {args.latency:.0f} ms/statement, {args.requests} requests")
+    print(f"wsgi sync worker         {sync:>8.1f} req/s")
+    print(f"wsgi 4 threads           {threaded:>8.1f} req/s")
+    print(f"{f'wsgi {args.concurrency} threads':<24} {many_threads:>8.1f} req/s")
+    print(f"asgi ({args.concurrency} concurrent)     {async_:>8.1f} req/s   x{async_ / sync:.1f} vs sync, "
+          f"x{async_ / many_threads:.1f} vs {args.concurrency} threads")
@@ -0,0 +1,276 @@
+"""
+Latency (p50/p95/p99), SQL queries and allocated memory per request of
+every route of src/app.py, driven through the Flask test client against a
+temporary SQLite database seeded with the given sizes. --check compares
+with endpoints_baseline.json and fails on regressions, --update writes a
+new baseline.
+
+    $ pipenv run python benchmarks/bench_endpoints.py --requests 200
+    $ pipenv run python benchmarks/bench_endpoints.py --only /planets --check
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import tempfile
+import tracemalloc
+from itertools import count
+
+DB_FILE = os.path.join(tempfile.mkdtemp(), "bench_endpoints.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_FILE}"
+# Only the routes of src/app.py, not the admin
+os.environ["ENABLE_ADMIN"] = "0"
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from sqlalchemy import event
+from app import app
+from models import db, User, Planet, Vehicle, Character, Favorite
+from leaderboard import rebuild_favorite_counts
+from auth import issue_token
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "endpoints_baseline.json")
+SIZES = {"users": 1000, "planets": 1000, "vehicles": 1000, "characters": 5000, "favorites": 10000}
+
+queries = 0
+unique = count()
+
+def count_queries(conn, cursor, statement, parameters, context, executemany):
+    global queries
+    queries += 1
+
+def insert(model, rows):
+    ids = [db.session.execute(model.__table__.insert().values(**row)).inserted_primary_key[0] for row in rows]
+    db.session.commit()
+    return ids
+
+def seed(sizes):
+    users, planets, vehicles, characters = (sizes[name] for name in ("users", "planets", "vehicles", "characters"))
+    with app.app_context():
+        db.create_all()
+        db.session.execute(User.__table__.insert(), [
+            {"email": f"user{i}@example.com", "username": f"u{i}", "password": "secret", "is_active": True}
+            for i in range(1, users + 1)
+        ])
+        db.session.execute(Planet.__table__.insert(), [
+            {"name": f"planet-{i}", "density": i * 0.5, "diameter": i * 1.5, "orbital_period": i % 400,
+             "population": i * 1000, "weater": "arid"}
+            for i in range(1, planets + 1)
+        ])
+        db.session.execute(Vehicle.__table__.insert(), [
+            {"name": f"vehicle-{i}", "crew": i % 50, "model": "T-65", "cargo_capacity": i * 2.5, "passengers": i % 10}
+            for i in range(1, vehicles + 1)
+        ])
+        db.session.execute(Character.__table__.insert(), [
+            {"name": f"character-{i}", "height": 150 + i % 60, "weight": 50 + i % 70,
+             "planet_origin_id": i % planets + 1, "vehicle_id": i % vehicles + 1}
+            for i in range(1, characters + 1)
+        ])
+        # Every (user, kind, item) is used once, so the unique index holds
+        rows = []
+        for i in range(sizes["favorites"]):
+            user_id, n = i % users + 1, i // users
+            kind = ("character_id", "planet_id", "vehicle_id")[n % 3]
+            item_id = n // 3 % {"character_id": characters, "planet_id": planets, "vehicle_id": vehicles}[kind] + 1
+            rows.append({"user_id": user_id, "character_id": None, "planet_id": None, "vehicle_id": None, kind: item_id})
+        db.session.execute(Favorite.__table__.insert(), rows)
+        rebuild_favorite_counts()
+        db.session.commit()
+
+def new_planet():
+    i = next(unique)
+    return {"name": f"new-planet-{i}", "density": 1.0, "diameter": 2.0, "orbital_period": 3, "population": 4, "weater": "wet"}
+
+def new_vehicle():
+    i = next(unique)
+    return {"name": f"new-vehicle-{i}", "crew": 1, "model": "X", "cargo_capacity": 2.0, "passengers": 3}
+
+def new_character(planet_id=1, vehicle_id=1):
+    i = next(unique)
+    return {"name": f"new-character-{i}", "height": 170, "weight": 70, "planet_id": planet_id, "vehicle_id": vehicle_id}
+
+def new_user():
+    i = next(unique)
+    return {"username": f"n{i}", "email": f"new{i}@example.com", "password": "secret"}
+
+def new_favorite():
+    planet_id, = insert(Planet, [new_planet()])
+    favorite_id, = insert(Favorite, [{"user_id": 1, "planet_id": planet_id}])
+    return favorite_id
+
+def new_user_row():
+    user = new_user()
+    insert(User, [dict(user, is_active=True)])
+    return user["username"]
+
+def character_row(character):
+    return dict(character, planet_origin_id=character.pop("planet_id"))
+
+def auth_header():
+    token, claims = issue_token(1)
+    return {"Authorization": f"Bearer {token}"}
+
+def cases(sizes):
+    """(name, method, setup) of every route. setup(i) runs before each request
+    and out of the measurement, and returns the url, the json body and
+    optionally the headers."""
+    def read(url):
+        return lambda i: (url, None)
+
+    def by_id(url, size):
+        return lambda i: (url.format(i % sizes[size] + 1), None)
+
+    def bulk(factory, size=100):
+        return lambda i: (None, [factory() for _ in range(size)])
+
+    return [
+        ("/", "GET", read("/")),
+        ("/internal/cache", "GET", read("/internal/cache")),
+        ("/internal/pool", "GET", read("/internal/pool")),
+        ("/metrics", "GET", read("/metrics")),
+        ("/login", "POST", lambda i: ("/login", {"username": f"u{i % sizes['users'] + 1}", "password": "secret"})),
+        ("/logout", "POST", lambda i: ("/logout", None, auth_header())),
+        ("/me", "GET", lambda i: ("/me", None, auth_header())),
+        ("/search", "GET", read("/search?q=planet-1")),
+        ("/stats/<string:resource>", "GET", read("/stats/planets")),
+        ("/export/<string:resource>", "GET", read("/export/characters?format=csv")),
+        ("/user", "GET", read("/user")),
+        ("/user", "POST", lambda i: ("/user", new_user())),
+        ("/user/<int:id>", "GET", by_id("/user/{}", "users")),
+        ("/user/<int:id>/favorites", "GET", by_id("/user/{}/favorites", "users")),
+        ("/user/<string:username>", "PUT", lambda i: (f"/user/u{i % sizes['users'] + 1}", {"password": f"p{i}"})),
+        ("/user/<string:username>", "DELETE", lambda i: (f"/user/{new_user_row()}", None)),
+        ("/favorites", "GET", read("/favorites?expand=character,planet,vehicle")),
+        ("/favorites", "POST", lambda i: ("/favorites", {"user_id": 1, "planet_id": insert(Planet, [new_planet()])[0]})),
+        ("/favorites/bulk", "POST", lambda i: (None, [{"user_id": 1, "planet_id": planet_id}
+                                                      for planet_id in insert(Planet, [new_planet() for _ in range(100)])])),
+        ("/favorites/top", "GET", read("/favorites/top?kind=planet")),
+        ("/favorites/tickets/<string:ticket>", "GET", read("/favorites/tickets/unknown")),
+        ("/favorites/<int:id>", "DELETE", lambda i: (f"/favorites/{new_favorite()}", None)),
+        ("/planets", "GET", read("/planets?population_gt=1000&sort=-population")),
+        ("/planets", "POST", lambda i: ("/planets", new_planet())),
+        ("/planets", "DELETE", lambda i: ("/planets?ids=" + ",".join(map(str, insert(Planet, [new_planet() for _ in range(10)]))), None)),
+        ("/planets/bulk", "POST", bulk(new_planet)),
+        ("/planets/<int:id>", "GET", by_id("/planets/{}", "planets")),
+        ("/planets/<int:id>", "DELETE", lambda i: (f"/planets/{insert(Planet, [new_planet()])[0]}", None)),
+        ("/characters", "GET", read("/characters?expand=planet,vehicle")),
+        ("/characters", "POST", lambda i: ("/characters", new_character())),
+        ("/characters", "DELETE", lambda i: ("/characters?ids=" + ",".join(map(str, insert(Character, [character_row(new_character()) for _ in range(10)]))), None)),
+        ("/characters/bulk", "POST", bulk(new_character)),
+        ("/characters/<int:id>", "GET", by_id("/characters/{}?expand=planet,vehicle", "characters")),
+        ("/characters/<int:id>", "DELETE", lambda i: (f"/characters/{insert(Character, [character_row(new_character())])[0]}", None)),
+        ("/vehicles", "GET", read("/vehicles")),
+        ("/vehicles", "POST", lambda i: ("/vehicles", new_vehicle())),
+        ("/vehicles", "DELETE", lambda i: ("/vehicles?ids=" + ",".join(map(str, insert(Vehicle, [new_vehicle() for _ in range(10)]))), None)),
+        ("/vehicles/bulk", "POST", bulk(new_vehicle)),
+        ("/vehicles/<int:id>", "GET", by_id("/vehicles/{}", "vehicles")),
+        ("/vehicles/<int:id>", "DELETE", lambda i: (f"/vehicles/{insert(Vehicle, [new_vehicle()])[0]}", None)),
+    ]
+
+def missing_routes(cases):
+    # New routes must get a case here, otherwise they are never measured
+    covered = {(name, method) for name, method, setup in cases}
+    routes = {(rule.rule, method) for rule in app.url_map.iter_rules() if rule.endpoint != "static"
+              for method in rule.methods - {"HEAD", "OPTIONS"}}
+    return sorted(routes - covered)
+
+def prepare(name, setup, i):
+    with app.app_context():
+        url, body, *headers = setup(i)
+    # Bulk routes only need the body
+    return url or name, body, headers[0] if headers else None
+
+def run(client, name, method, setup, requests, warmup):
+    global queries
+    for i in range(warmup):
+        url, body, headers = prepare(name, setup, i)
+        client.open(url, method=method, json=body, headers=headers, buffered=True)
+
+    timings, query_counts = [], []
+    for i in range(warmup, warmup + requests):
+        url, body, headers = prepare(name, setup, i)
+        queries = 0
+        start = time.perf_counter()
+        response = client.open(url, method=method, json=body, headers=headers, buffered=True)
+        timings.append((time.perf_counter() - start) * 1000)
+        query_counts.append(queries)
+        assert response.status_code < 500, f"{method} {url}: {response.status_code} {response.data[:200]}"
+
+    # Allocations are measured apart, tracemalloc slows every request down
+    allocated = []
+    tracemalloc.start()
+    for i in range(warmup + requests, warmup + requests + min(requests, 20)):
+        url, body, headers = prepare(name, setup, i)
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        client.open(url, method=method, json=body, headers=headers, buffered=True)
+        allocated.append((tracemalloc.get_traced_memory()[1] - before) / 1024)
+    tracemalloc.stop()
+
+    p = statistics.quantiles(timings, n=100)
+    return {"p50": round(p[49], 3), "p95": round(p[94], 3), "p99": round(p[98], 3),
+            "queries": round(statistics.mean(query_counts), 2), "peak_kib": round(statistics.median(allocated), 1)}
+
+def compare(results, baseline):
+    """Regressions against the baseline: p50 and memory over the tolerance,
+    or any extra query per request."""
+    regressions = []
+    tolerance = baseline["tolerance"]
+    for key, result in results.items():
+        old = baseline["endpoints"].get(key, None)
+        if old is None:
+            continue
+        if result["p50"] > old["p50"] * (1 + tolerance):
+            regressions.append(f"{key}: p50 {result['p50']} ms, baseline {old['p50']} ms")
+        if result["queries"] > old["queries"]:
+            regressions.append(f"{key}: {result['queries']} queries per request, baseline {old['queries']}")
+        if result["peak_kib"] > old["peak_kib"] * (1 + tolerance):
+            regressions.append(f"{key}: {result['peak_kib']} KiB, baseline {old['peak_kib']} KiB")
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    for name, default in SIZES.items():
+        parser.add_argument(f"--{name}", type=int, default=default)
+    parser.add_argument("--requests", type=int, default=100, help="measured requests per endpoint")
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--only", default=None, help="only the routes that start with this path")
+    parser.add_argument("--check", action="store_true", help="fail on regressions against the baseline")
+    parser.add_argument("--update", action="store_true", help="save the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.3, help="allowed slowdown for --update")
+    args = parser.parse_args()
+
+    sizes = {name: getattr(args, name) for name in SIZES}
+    seed(sizes)
+    all_cases = cases(sizes)
+    missing = missing_routes(all_cases)
+    if missing:
+        sys.exit("Routes without a benchmark case: " + ", ".join(f"{method} {name}" for name, method in missing))
+
+    with app.app_context():
+        event.listen(db.engine, "before_cursor_execute", count_queries)
+    client = app.test_client()
+    results = {}
+    print(f"{'endpoint':<36} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>8} {'peak KiB':>9}")
+    for name, method, setup in all_cases:
+        if args.only and not name.startswith(args.only):
+            continue
+        key = f"{method} {name}"
+        results[key] = run(client, name, method, setup, args.requests, args.warmup)
+        r = results[key]
+        print(f"{key:<36} {r['p50']:>8.2f} {r['p95']:>8.2f} {r['p99']:>8.2f} {r['queries']:>8} {r['peak_kib']:>9}")
+
+    if args.update:
+        with open(BASELINE, "w") as baseline_file:
+            json.dump({"sizes": sizes, "tolerance": args.tolerance, "endpoints": results}, baseline_file, indent=2)
+            baseline_file.write("\n")
+    if args.check:
+        with open(BASELINE) as baseline_file:
+            baseline = json.load(baseline_file)
+        if baseline["sizes"] != sizes:
+            sys.exit(f"The baseline was measured with other sizes: {baseline['sizes']}")
+        regressions = compare(results, baseline)
+        for regression in regressions:
+            print("REGRESSION:", regression)
+        sys.exit(1 if regressions else 0)
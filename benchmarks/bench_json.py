@@ -0,0 +1,103 @@
+"""
+Throughput of GET /planets with 100k rows, comparing the stdlib JSON
+provider with orjson, with and without the per-row fragment cache. The
+last run adds a POST /planets every --write-every pages, to show the hit
+rate of the fragment cache under writes: each row is keyed by its own
+row_version, so a write only misses the rows it changed.
+
+    $ pipenv run python benchmarks/bench_json.py --rows 100000 --write-every 10
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+DB_FILE = os.path.join(tempfile.mkdtemp(), "bench_json.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_FILE}"
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from flask.json.provider import DefaultJSONProvider
+from app import app
+from models import db, Planet
+from cache import FragmentCache
+from fastjson import OrjsonProvider, orjson
+
+def seed(rows):
+    with app.app_context():
+        db.create_all()
+        db.session.execute(Planet.__table__.insert(), [
+            {"name": f"planet-{i}", "density": i * 0.5, "diameter": i * 1.5, "orbital_period": i % 400,
+             "population": i * 1000, "weater": "arid"}
+            for i in range(rows)
+        ])
+        db.session.commit()
+
+def walk_pages(client, write_every=0):
+    rows = 0
+    pages = 0
+    url = "/planets?limit=100"
+    while url:
+        body = client.get(url).get_json()
+        rows += len(body["results"])
+        pages += 1
+        if write_every and pages % write_every == 0:
+            response = client.post("/planets", json={"name": f"written-{time.perf_counter_ns()}", "density": 1,
+                                                     "diameter": 1, "orbital_period": 1, "population": 1, "weater": "arid"})
+            assert response.status_code == 201, response.data
+        url = f"/planets?limit=100&after={body['next']}" if body["next"] else None
+    return rows
+
+def stream(client):
+    return len(client.get("/planets?stream=1").get_json())
+
+def details(client, count=5000):
+    # jsonify() of a cached dict, so the time is mostly the JSON encoding
+    for id in range(1, count + 1):
+        assert client.get(f"/planets/{id}").status_code == 200
+    return count
+
+def run(name, provider_class, fragment_size, rows):
+    app.json = provider_class(app)
+    app.extensions["fragment_cache"] = FragmentCache(max_size=fragment_size)
+    client = app.test_client()
+    results = {}
+    for label, request_fn in [("pages", walk_pages), ("stream", stream), ("details", details)]:
+        # First pass fills the caches, the second one is measured
+        expected = request_fn(client)
+        start = time.perf_counter()
+        assert request_fn(client) == expected
+        results[label] = expected / (time.perf_counter() - start)
+    print(f"{name:<28} pages: {results['pages']:>10,.0f} rows/s   stream: {results['stream']:>10,.0f} rows/s   "
+          f"details: {results['details']:>7,.0f} req/s")
+    return results
+
+def run_with_writes(provider_class, rows, write_every):
+    app.json = provider_class(app)
+    fragment_cache = app.extensions["fragment_cache"] = FragmentCache(max_size=rows * 2)
+    client = app.test_client()
+    walk_pages(client)
+    before = fragment_cache.stats()
+    start = time.perf_counter()
+    read = walk_pages(client, write_every)
+    elapsed = time.perf_counter() - start
+    after = fragment_cache.stats()
+    hits, misses = after["hits"] - before["hits"], after["misses"] - before["misses"]
+    print(f"{f'1 write / {write_every} pages':<28} pages: {read / elapsed:>10,.0f} rows/s   "
+          f"fragment hit rate {hits / max(hits + misses, 1):.1%}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--write-every", type=int, default=10, help="pages between writes in the last run")
+    args = parser.parse_args()
+
+    seed(args.rows)
+    base = run("stdlib", DefaultJSONProvider, 0, args.rows)
+    if orjson is not None:
+        run("orjson", OrjsonProvider, 0, args.rows)
+    fast = run("orjson + fragment cache" if orjson else "stdlib + fragment cache",
+               OrjsonProvider if orjson else DefaultJSONProvider, args.rows, args.rows)
+    print(f"gain: pages x{fast['pages'] / base['pages']:.2f}, stream x{fast['stream'] / base['stream']:.2f}, "
+          f"details x{fast['details'] / base['details']:.2f}")
+    run_with_writes(OrjsonProvider if orjson else DefaultJSONProvider, args.rows, args.write_every)
@@ -0,0 +1,84 @@
+"""
+Cold start time: from the first import of the app to the first response,
+measured in a fresh interpreter each run. With --check it fails when the
+median is slower than startup_baseline.json (plus the tolerance), and
+--update writes a new baseline.
+
+    $ pipenv run python benchmarks/bench_startup.py --runs 5
+    $ pipenv run python benchmarks/bench_startup.py --check
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "startup_baseline.json")
+
+CHILD = """
+import time
+start = time.perf_counter()
+from app import app
+imported = time.perf_counter()
+app.test_client().get('/')
+done = time.perf_counter()
+print((imported - start) * 1000, (done - start) * 1000)
+"""
+
+def measure(runs, env):
+    imports, first_responses = [], []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", CHILD], cwd=os.path.join(ROOT, "src"), env=env,
+                                capture_output=True, text=True, check=True).stdout
+        imported, first_response = map(float, output.split())
+        imports.append(imported)
+        first_responses.append(first_response)
+    return statistics.median(imports), statistics.median(first_responses)
+
+def slowest_imports(env, count=10):
+    # -X importtime writes one line per module to stderr: self | cumulative | name
+    stderr = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"], cwd=os.path.join(ROOT, "src"),
+                            env=env, capture_output=True, text=True, check=True).stderr
+    modules = []
+    for line in stderr.splitlines()[1:]:
+        self_time, cumulative, name = line.split("|")
+        if not name.startswith("   "):
+            continue
+        # Only the direct imports of app.py
+        if len(name) - len(name.lstrip()) == 3:
+            modules.append((int(cumulative) / 1000, name.strip()))
+    return sorted(modules, reverse=True)[:count]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--check", action="store_true", help="fail if slower than the baseline")
+    parser.add_argument("--update", action="store_true", help="save the result as the new baseline")
+    args = parser.parse_args()
+
+    results = {}
+    for label, enable_admin in [("admin enabled", "1"), ("admin disabled", "0")]:
+        env = dict(os.environ, ENABLE_ADMIN=enable_admin)
+        imported, first_response = measure(args.runs, env)
+        results[label] = round(first_response, 1)
+        print(f"{label:<16} import {imported:7.1f} ms   first response {first_response:7.1f} ms")
+    print("slowest imports of app.py (admin disabled):")
+    for cumulative, name in slowest_imports(dict(os.environ, ENABLE_ADMIN="0")):
+        print(f"  {cumulative:7.1f} ms  {name}")
+
+    if args.update:
+        with open(BASELINE, "w") as baseline_file:
+            json.dump({"first_response_ms": results, "tolerance": 0.25}, baseline_file, indent=2)
+            baseline_file.write("\n")
+    if args.check:
+        with open(BASELINE) as baseline_file:
+            baseline = json.load(baseline_file)
+        failed = False
+        for label, value in results.items():
+            limit = baseline["first_response_ms"][label] * (1 + baseline["tolerance"])
+            if value > limit:
+                print(f"REGRESSION: {label} took {value} ms, the limit is {limit:.1f} ms")
+                failed = True
+        sys.exit(1 if failed else 0)
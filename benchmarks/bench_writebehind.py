@@ -0,0 +1,82 @@
+"""
+Throughput of POST /favorites with one commit per request against the
+WRITE_BEHIND batches, with several client threads on a SQLite file. Each
+mode runs in its own process (the mode is read when the app is imported).
+
+    $ pipenv run python benchmarks/bench_writebehind.py --requests 5000 --threads 8
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+def run(requests, threads):
+    from sqlalchemy import event
+    from app import app, favorite_writer
+    from models import db, User, Planet
+
+    commits = 0
+    def count_commit(conn):
+        nonlocal commits
+        commits += 1
+
+    users = 1000
+    with app.app_context():
+        db.create_all()
+        db.session.execute(User.__table__.insert(), [
+            {"email": f"user{i}@example.com", "username": f"u{i}", "password": "secret", "is_active": True}
+            for i in range(users)
+        ])
+        db.session.execute(Planet.__table__.insert(), [
+            {"name": f"planet-{i}", "density": 1, "diameter": 1, "orbital_period": 1, "population": 1, "weater": "arid"}
+            for i in range(requests // users + 1)
+        ])
+        db.session.commit()
+        event.listen(db.engine, "commit", count_commit)
+
+    def post(i):
+        client = app.test_client()
+        start = time.perf_counter()
+        response = client.post("/favorites", json={"user_id": i % users + 1, "planet_id": i // users + 1})
+        assert response.status_code in (200, 202), response.data
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        latencies = list(pool.map(post, range(requests)))
+    if favorite_writer is not None:
+        # Everything queued is written before the clock stops
+        favorite_writer.close()
+    elapsed = time.perf_counter() - start
+
+    with app.app_context():
+        stored = db.session.execute(db.text("SELECT count(*) FROM favorite")).scalar()
+    assert stored == requests, f"{stored} favorites stored, expected {requests}"
+    mode = "write-behind" if favorite_writer is not None else "per request"
+    print(f"{mode:<14} {requests / elapsed:>9,.0f} favorites/s   p50 {statistics.median(latencies) * 1000:6.2f} ms   "
+          f"{commits:>6} commits")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--batch", type=int, default=500, help="WRITE_BEHIND_BATCH")
+    parser.add_argument("--interval", type=float, default=0.05, help="WRITE_BEHIND_INTERVAL")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+        run(args.requests, args.threads)
+        sys.exit(0)
+
+    for write_behind in ("0", "1"):
+        env = dict(os.environ, WRITE_BEHIND=write_behind, WRITE_BEHIND_BATCH=str(args.batch),
+                   WRITE_BEHIND_INTERVAL=str(args.interval), ENABLE_ADMIN="0",
+                   DATABASE_URL=f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench_writebehind.db')}")
+        subprocess.run([sys.executable, __file__, "--child", "--requests", str(args.requests),
+                        "--threads", str(args.threads)], env=env, check=True)
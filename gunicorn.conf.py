@@ -0,0 +1,73 @@
+"""
+Gunicorn settings used by the Procfile and render.yaml:
+
+    $ gunicorn -c gunicorn.conf.py wsgi --chdir ./src/
+
+Every value can be changed with an environment variable.
+"""
+import os
+import tempfile
+import multiprocessing
+
+bind = f"0.0.0.0:{os.getenv('PORT', 3000)}"
+
+# WEB_CONCURRENCY is the variable Render and Heroku use for the worker count.
+# Remember: workers * DB_POOL_SIZE must fit in the Postgres connection limit
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.getenv("GUNICORN_THREADS", 2))
+worker_class = "gthread" if threads > 1 else "sync"
+
+# Load the app once in the master so the workers share its memory (copy on write)
+preload_app = os.getenv("GUNICORN_PRELOAD", "1") == "1"
+
+# Restart workers from time to time so leaks can not pile up
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", 1000))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", 100))
+
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 30))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", 30))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", 5))
+accesslog = os.getenv("GUNICORN_ACCESS_LOG", None)
+
+# Every worker saves its /metrics counters in this directory and /metrics
+# adds them all up. One directory per server run (the master pid), so a
+# restart starts the counters from zero like any other process restart
+os.environ.setdefault("METRICS_DIR", os.path.join(tempfile.gettempdir(), f"api-metrics-{os.getpid()}"))
+
+# Worker lifecycle events, counted in the master
+worker_events = {"started": 0, "exited": 0}
+
+def log_worker_event(server, event, worker):
+    worker_events[event] += 1
+    server.log.info("worker %s age=%s totals=%s", event, worker.age, worker_events)
+
+def when_ready(server):
+    server.log.info("gunicorn ready: workers=%s threads=%s class=%s preload=%s",
+                    workers, threads, worker_class, preload_app)
+
+def post_fork(server, worker):
+    # With preload the engine (and any pooled connection) was created in the
+    # master. Give this worker its own pool, without closing the connections
+    # that still belong to the parent process.
+    from app import app
+    from models import db
+    with app.app_context():
+        db.engine.dispose(close=False)
+
+def pre_fork(server, worker):
+    log_worker_event(server, "started", worker)
+
+def worker_abort(worker):
+    worker.log.warning("worker aborted (timeout) pid=%s", worker.pid)
+
+def child_exit(server, worker):
+    # pre_fork and child_exit run in the master, so the totals count every
+    # worker of the server, including the ones recycled by max_requests
+    log_worker_event(server, "exited", worker)
+
+def worker_exit(server, worker):
+    # Runs in the worker on a graceful stop (and when max_requests recycles
+    # it): write the favorites still waiting in the WRITE_BEHIND queue
+    from app import favorite_writer
+    if favorite_writer is not None:
+        favorite_writer.close()
@@ -0,0 +1,41 @@
+"""unique favorite per user and items
+
+Revision ID: c81d4f0e9a27
+Revises: 7a2e5b8c4d10
+Create Date: 2026-10-18 10:41:09.316554
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c81d4f0e9a27'
+down_revision = '7a2e5b8c4d10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Remove the duplicates left by retried POSTs before adding the index
+    op.execute(
+        "DELETE FROM favorite WHERE id NOT IN ("
+        "SELECT keep_id FROM (SELECT MIN(id) AS keep_id FROM favorite "
+        "GROUP BY user_id, COALESCE(character_id, 0), COALESCE(planet_id, 0), COALESCE(vehicle_id, 0)"
+        ") AS first_favorites)"
+    )
+    op.create_index(
+        'uq_favorite_items',
+        'favorite',
+        [
+            'user_id',
+            sa.text('coalesce(character_id, 0)'),
+            sa.text('coalesce(planet_id, 0)'),
+            sa.text('coalesce(vehicle_id, 0)')
+        ],
+        unique=True
+    )
+
+
+def downgrade():
+    op.drop_index('uq_favorite_items', table_name='favorite')
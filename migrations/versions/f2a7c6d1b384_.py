@@ -0,0 +1,54 @@
+"""add name search index
+
+Revision ID: f2a7c6d1b384
+Revises: e5b09c3a6f12
+Create Date: 2026-10-18 11:58:26.190447
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2a7c6d1b384'
+down_revision = 'e5b09c3a6f12'
+branch_labels = None
+depends_on = None
+
+KINDS = ['character', 'planet', 'vehicle']
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for kind in KINDS:
+            op.execute(f'CREATE INDEX IF NOT EXISTS ix_{kind}_name_trgm ON "{kind}" USING gin (name gin_trgm_ops)')
+    elif dialect == 'sqlite':
+        for kind in KINDS:
+            op.execute(f'CREATE VIRTUAL TABLE IF NOT EXISTS search_{kind} USING fts5(name)')
+            op.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS search_{kind}_insert AFTER INSERT ON "{kind}" BEGIN
+                    INSERT INTO search_{kind}(rowid, name) VALUES (new.id, new.name);
+                END''')
+            op.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS search_{kind}_delete AFTER DELETE ON "{kind}" BEGIN
+                    DELETE FROM search_{kind} WHERE rowid = old.id;
+                END''')
+            op.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS search_{kind}_update AFTER UPDATE OF name ON "{kind}" BEGIN
+                    UPDATE search_{kind} SET name = new.name WHERE rowid = new.id;
+                END''')
+            op.execute(f'INSERT INTO search_{kind}(rowid, name) SELECT id, name FROM "{kind}"')
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        for kind in KINDS:
+            op.execute(f'DROP INDEX IF EXISTS ix_{kind}_name_trgm')
+    elif dialect == 'sqlite':
+        for kind in KINDS:
+            for trigger in ['insert', 'delete', 'update']:
+                op.execute(f'DROP TRIGGER IF EXISTS search_{kind}_{trigger}')
+            op.execute(f'DROP TABLE IF EXISTS search_{kind}')
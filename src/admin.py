@@ -3,18 +3,23 @@ from flask_admin import Admin
 from models import db, User, Character, Favorite, Planet, Vehicle
 from flask_admin.contrib.sqla import ModelView
 
+class RowModelView(ModelView):
+    # row_version changes by itself on every write
+    column_exclude_list = ("row_version",)
+    form_excluded_columns = ("row_version",)
+
 def setup_admin(app):
-    app.secret_key = os.environ.get('FLASK_APP_KEY', 'sample key')
+    # The session key is app.config['SECRET_KEY'] (app.py), that also signs the tokens
     app.config['FLASK_ADMIN_SWATCH'] = 'cerulean'
     admin = Admin(app, name='STAR WARS API', template_mode='bootstrap3')
 
     
     # Add your models here, for example this is how we add a the User model to the admin
-    admin.add_view(ModelView(User, db.session))
-    admin.add_view(ModelView(Character, db.session))
-    admin.add_view(ModelView(Favorite, db.session))
-    admin.add_view(ModelView(Planet, db.session))
-    admin.add_view(ModelView(Vehicle, db.session))
+    admin.add_view(RowModelView(User, db.session))
+    admin.add_view(RowModelView(Character, db.session))
+    admin.add_view(RowModelView(Favorite, db.session))
+    admin.add_view(RowModelView(Planet, db.session))
+    admin.add_view(RowModelView(Vehicle, db.session))
 
     # You can duplicate that line to add mew models
     # admin.add_view(ModelView(YourModelName, db.session))
\ No newline at end of file
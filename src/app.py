@@ -2,17 +2,33 @@
 This module takes care of starting the API Server, Loading the DB and Adding the endpoints
 """
 import os
-from flask import Flask, request, jsonify, url_for
-from flask_migrate import Migrate
-from flask_swagger import swagger
+import click
+import secrets
+from flask import Flask, request, jsonify, url_for, g
 from flask_cors import CORS
-from utils import APIException, generate_sitemap
-from admin import setup_admin
+from sqlalchemy import exists
+from sqlalchemy.orm import joinedload
+from utils import APIException, generate_sitemap, paginate, wants_stream, stream_json, page_response
+from utils import get_bulk_items, missing_fields, find_existing, bulk_insert, conditional, committed_version
+from utils import get_expand, expand_options, get_ids, batch_delete, insert_ignore, apply_filters, get_page_size
+from cache import DetailCache, FragmentCache
+from fastjson import get_json_provider_class
+from metrics import Metrics
+from detector import QueryDetector
+from pool import get_engine_options, get_pool_status
+from search import search, SEARCHABLE
+from stats import StatsCache
+from auth import hash_password, check_login, needs_rehash, issue_token, login_required, check_owner, RevocationList
+from catalog import CatalogImporter
+from writebehind import FavoriteWriter
+from export import EXPORTS, FORMATS, export_table
+from leaderboard import KINDS, count_favorite, insert_favorites, rebuild_favorite_counts, top_favorites
 from models import db, User, Character, Favorite, Planet, Vehicle
 #from models import Person
 
 app = Flask(__name__)
 app.url_map.strict_slashes = False
+app.json = get_json_provider_class()(app)
 
 db_url = os.getenv("DATABASE_URL")
 if db_url is not None:
@@ -20,11 +36,72 @@ if db_url is not None:
 else:
     app.config['SQLALCHEMY_DATABASE_URI'] = "sqlite:////tmp/test.db"
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = get_engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
+app.config['MAX_PAGE_SIZE'] = int(os.getenv("MAX_PAGE_SIZE", 100))
+app.config['MAX_BULK_SIZE'] = int(os.getenv("MAX_BULK_SIZE", 50000))
+#Clave para firmar los tokens, tiene que ser la misma en todos los workers
+#(sin FLASK_APP_KEY cada proceso usa una al azar y los tokens solo sirven en ese proceso)
+app.config['SECRET_KEY'] = os.getenv("FLASK_APP_KEY") or secrets.token_hex(32)
+app.config['AUTH_TOKEN_TTL'] = int(os.getenv("AUTH_TOKEN_TTL", 3600))
+#Con REQUIRE_AUTH=1 crear y borrar favoritos necesita el token del mismo usuario
+app.config['REQUIRE_AUTH'] = os.getenv("REQUIRE_AUTH", "0") == "1"
+#Con WRITE_BEHIND=1 los POST/DELETE de favoritos se encolan y se escriben por lotes (responden 202 con un ticket)
+app.config['WRITE_BEHIND'] = os.getenv("WRITE_BEHIND", "0") == "1"
+app.config['WRITE_BEHIND_BATCH'] = int(os.getenv("WRITE_BEHIND_BATCH", 500))
+app.config['WRITE_BEHIND_INTERVAL'] = float(os.getenv("WRITE_BEHIND_INTERVAL", 0.05))
+#Segundos que se guarda el resultado de cada ticket en la tabla favorite_ticket
+app.config['WRITE_BEHIND_TICKET_TTL'] = int(os.getenv("WRITE_BEHIND_TICKET_TTL", 3600))
+#Detector de N+1 y consultas lentas: off, log o raise (la request falla con 500, para tests y staging)
+app.config['QUERY_DETECTOR'] = os.getenv("QUERY_DETECTOR", "off")
+app.config['QUERY_REPEAT_THRESHOLD'] = int(os.getenv("QUERY_REPEAT_THRESHOLD", 5))
+app.config['SLOW_QUERY_MS'] = float(os.getenv("SLOW_QUERY_MS", 100))
+app.config['MAX_QUERIES_PER_REQUEST'] = int(os.getenv("MAX_QUERIES_PER_REQUEST", 0))
+
+#Cache de los GET por id (planet, vehicle, character, user)
+detail_cache = DetailCache(max_size=int(os.getenv("CACHE_MAX_SIZE", 1024)), ttl=float(os.getenv("CACHE_TTL", 300)))
+
+#Estadisticas de /stats, se actualizan con cada create/delete
+stats_cache = StatsCache(buckets=int(os.getenv("STATS_BUCKETS", 10)))
+
+#Tokens revocados (logout), se recargan de la base cada AUTH_REVOCATION_TTL segundos
+app.extensions['revoked_tokens'] = RevocationList(ttl=float(os.getenv("AUTH_REVOCATION_TTL", 30)))
+
+#Cola de escrituras de favoritos (solo con WRITE_BEHIND=1)
+favorite_writer = None
+if app.config['WRITE_BEHIND']:
+    favorite_writer = FavoriteWriter(app, max_batch=app.config['WRITE_BEHIND_BATCH'],
+                                     interval=app.config['WRITE_BEHIND_INTERVAL'],
+                                     ticket_ttl=app.config['WRITE_BEHIND_TICKET_TTL'])
+
+#JSON ya codificado de cada fila para los listados (0 lo desactiva)
+app.extensions['fragment_cache'] = FragmentCache(max_size=int(os.getenv("FRAGMENT_CACHE_SIZE", 100000)))
 
-MIGRATE = Migrate(app, db)
 db.init_app(app)
 CORS(app)
-setup_admin(app)
+
+#Latencia, status y consultas SQL por endpoint en /metrics (formato de Prometheus)
+#Con METRICS_DIR (gunicorn.conf.py lo pone) cada worker guarda sus numeros ahi y /metrics suma los de todos
+#Con ENABLE_METRICS=0 no se mide nada y /metrics solo devuelve ceros, sin archivos
+enable_metrics = os.getenv("ENABLE_METRICS", "1") == "1"
+metrics = Metrics(directory=(os.getenv("METRICS_DIR") or None) if enable_metrics else None,
+                  interval=float(os.getenv("METRICS_INTERVAL", 1)))
+if enable_metrics:
+    metrics.init_app(app)
+
+query_detector = QueryDetector(app.config['QUERY_DETECTOR'], repeat_threshold=app.config['QUERY_REPEAT_THRESHOLD'],
+                               slow_ms=app.config['SLOW_QUERY_MS'], max_statements=app.config['MAX_QUERIES_PER_REQUEST'])
+query_detector.init_app(app)
+
+#Flask-Migrate (alembic) solo hace falta para los comandos "flask db ...",
+#el app solo se carga dentro de un contexto de click cuando la abre el CLI de flask
+if click.get_current_context(silent=True) is not None or os.getenv("ENABLE_MIGRATE", "0") == "1":
+    from flask_migrate import Migrate
+    MIGRATE = Migrate(app, db)
+
+#El admin tarda en cargar, ENABLE_ADMIN=0 lo desactiva (arranques en frio mas rapidos)
+if os.getenv("ENABLE_ADMIN", "1") == "1":
+    from admin import setup_admin
+    setup_admin(app)
 
 # Handle/serialize errors like a JSON object
 @app.errorhandler(APIException)
@@ -36,22 +113,142 @@ def handle_invalid_usage(error):
 def sitemap():
     return generate_sitemap(app)
 
+@app.route('/internal/cache', methods=['GET'])
+def get_cache_stats():
+    return jsonify({"detail": detail_cache.stats(), "fragments": app.extensions['fragment_cache'].stats(),
+                    "write_behind": favorite_writer.stats() if favorite_writer is not None else None}), 200
+
+@app.route('/internal/pool', methods=['GET'])
+def get_pool_stats():
+    return jsonify(get_pool_status(db.engine)), 200
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    return metrics.render(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+#SEARCH - busca por nombre en characters, planets y vehicles
+@app.route('/search', methods=['GET'])
+@conditional('character', 'planet', 'vehicle')
+def search_by_name():
+    q = request.args.get('q', '').strip()
+    if not q:
+        return jsonify({"error": "Missing q"}), 400
+    kind = request.args.get('kind', None)
+    if kind is not None and kind not in SEARCHABLE:
+        return jsonify({"error": f"kind must be one of: {', '.join(SEARCHABLE)}"}), 400
+    kinds = [kind] if kind is not None else list(SEARCHABLE)
+    return jsonify({"results": search(q, kinds, get_page_size())}), 200
+
+#STATS - count, min/max/mean e histograma por columna
+@app.route('/stats/<string:resource>', methods=['GET'])
+@conditional('character', 'planet', 'vehicle')
+def get_stats(resource):
+    models = {"planets": Planet, "vehicles": Vehicle, "characters": Character}
+    if resource not in models:
+        return jsonify({"error": f"No stats for {resource}"}), 404
+    return jsonify(stats_cache.get(models[resource])), 200
+
+#EXPORT - toda la tabla en NDJSON o CSV, ?since_id= para traer solo lo nuevo
+@app.route('/export/<string:resource>', methods=['GET'])
+def export_resource(resource):
+    if resource not in EXPORTS:
+        return jsonify({"error": f"resource must be one of: {', '.join(EXPORTS)}"}), 404
+    file_format = request.args.get('format', 'ndjson')
+    if file_format not in FORMATS:
+        return jsonify({"error": f"format must be one of: {', '.join(FORMATS)}"}), 400
+    since_id = request.args.get('since_id', '0')
+    try:
+        since_id = int(since_id)
+    except ValueError:
+        return jsonify({"error": f"Invalid since_id: {since_id}"}), 400
+    #gzip;q=0 quiere decir que no
+    gzip = request.accept_encodings.quality('gzip') > 0
+    return export_table(EXPORTS[resource], file_format, since_id=since_id, gzip=gzip)
+
+#AUTH - login con username o email y password, devuelve un token firmado
+@app.route('/login', methods=['POST'])
+def login():
+    body = request.json or {}
+    if not isinstance(body, dict):
+        return jsonify({"error": "Body must be an object"}), 400
+    username = body.get('username', None)
+    email = body.get('email', None)
+    password = body.get('password', None)
+    if (username == None and email == None) or password == None:
+        return jsonify({"error": "Missing username or email, or password"}), 400
+    if not all(isinstance(value, str) for value in (username, email, password) if value is not None):
+        return jsonify({"error": "username, email and password must be strings"}), 400
+
+    query = User.query.filter_by(username=username) if username != None else User.query.filter_by(email=email)
+    searched_user = query.one_or_none()
+    #Si el usuario no existe igual se comprueba un hash, asi tarda lo mismo
+    if not check_login(searched_user, password):
+        return jsonify({"error": "Wrong username or password"}), 401
+
+    #Passwords guardados antes del hash se cambian por su hash ahora
+    if needs_rehash(searched_user.password):
+        searched_user.password = hash_password(password)
+        db.session.commit()
+
+    token, claims = issue_token(searched_user.id)
+    return jsonify({"token": token, "expires_at": claims["exp"], "user": searched_user.serialize()}), 200
+
+@app.route('/logout', methods=['POST'])
+@login_required()
+def logout():
+    app.extensions['revoked_tokens'].revoke(g.token_claims)
+    db.session.commit()
+    return jsonify({"msg": "success"}), 200
+
+#Datos del token, sin consultar la base
+@app.route('/me', methods=['GET'])
+@login_required()
+def get_me():
+    return jsonify({"id": g.user_id, "expires_at": g.token_claims["exp"]}), 200
+
 #CRUD FOR USERS
 #1.READ - query.all()
 @app.route('/user', methods=['GET'])
+@conditional('user')
 def handle_hello():
 
-    users = User.query.all()
-    usuarios_serializados = [persona.serialize() for persona in users]
-    return jsonify(usuarios_serializados), 200
+    if wants_stream():
+        return stream_json(User.query, User)
+
+    users, next_cursor = paginate(User.query, User)
+    return page_response(users, next_cursor, User), 200
 
 @app.route('/user/<int:id>', methods=['GET'])
+@conditional('user')
 def get_user(id):
 
-    searched_user = User.query.filter_by(id=id).one_or_none()
-    usuario_serializado = searched_user.serialize()
+    usuario_serializado = detail_cache.get('user', id, g.table_versions['user'])
+    if usuario_serializado is None:
+        searched_user = User.query.filter_by(id=id).one_or_none()
+        if searched_user is None:
+            return jsonify({"error": f"User with id: {id} not found"}), 404
+        usuario_serializado = searched_user.serialize()
+        detail_cache.set('user', id, g.table_versions['user'], usuario_serializado)
     return jsonify(usuario_serializado), 200
 
+@app.route('/user/<int:id>/favorites', methods=['GET'])
+@conditional('user', 'favorite', 'character', 'planet', 'vehicle')
+def get_user_favorites(id):
+
+    searched_user = User.query.get(id)
+    if searched_user is None:
+        return jsonify({"error": f"User with id: {id} not found"}), 404
+
+    #joinedload trae character, planet y vehicle en la misma consulta (sin lazy loads por fila)
+    query = Favorite.query.filter_by(user_id=id).options(
+        joinedload(Favorite.character),
+        joinedload(Favorite.planet),
+        joinedload(Favorite.vehicle)
+    )
+    favorites, next_cursor = paginate(query, Favorite)
+    fav_serializados = [favorite.serialize_with_items() for favorite in favorites]
+    return jsonify({"results": fav_serializados, "next": next_cursor}), 200
+
 
 #2.CREATE - save()
 @app.route('/user', methods = ['POST'])
@@ -67,10 +264,11 @@ def add_user():
         return jsonify({"msg": "Missing fields"}), 400
     
     try:
-        new_user = User(email=email, username=username, password=password)
+        new_user = User(email=email, username=username, password=hash_password(password))
 
         db.session.add(new_user) #Memoria RAM
         db.session.commit() #Se guarda con las intruccion SQL CREATE
+        detail_cache.invalidate('user', new_user.id)
 
         return jsonify({"msg": "success"}), 201
     
@@ -85,6 +283,7 @@ def remove_user(username):
     if searched_user != None:
         db.session.delete(searched_user)
         db.session.commit()
+        detail_cache.invalidate('user', searched_user.id)
         return jsonify(searched_user.serialize()), 202
     else:
         return jsonify({"error" : f"User with username: {username} not found" }), 500
@@ -105,9 +304,10 @@ def update_user(username):
             searched_user.username = new_username
 
         if password !=None:
-            searched_user.password = password
+            searched_user.password = hash_password(password)
 
         db.session.commit()
+        detail_cache.invalidate('user', searched_user.id)
 
         return jsonify(searched_user.serialize()), 202
     else:
@@ -117,12 +317,18 @@ def update_user(username):
 #CRUD FOR FAVORITES
 #1.READ
 @app.route('/favorites', methods= ['GET'])
+@conditional('favorite', 'user', 'character', 'planet', 'vehicle')
 def get_favorites():
-    favorites = Favorite.query.all()
-    fav_serializados = [favorite.serialize() for favorite in favorites]
-    return jsonify(fav_serializados), 200
+    expand = get_expand(Favorite)
+    query = apply_filters(Favorite.query, Favorite).options(*expand_options(Favorite, expand))
+    if wants_stream():
+        return stream_json(query, Favorite, expand=expand)
+
+    favorites, next_cursor = paginate(query, Favorite)
+    return page_response(favorites, next_cursor, Favorite, expand=expand), 200
 #2.CREATE
 @app.route('/favorites', methods=['POST'])
+@login_required(optional=True)
 def new_favorite():
 
     body = request.json
@@ -134,41 +340,128 @@ def new_favorite():
 
     if user_id ==None:
         return jsonify({"error": "Missing user_id"}), 400
-    #Buscar si el usuario, character, planet y vehiculo existen en la tabla
-    user = User.query.get(user_id)
-    character = Character.query.get(character_id) if character_id is not None else None
-    planet = Planet.query.get(planet_id) if planet_id is not None else None
-    vehicle = Vehicle.query.get(vehicle_id) if vehicle_id is not None else None
+    check_owner(user_id)
+    if character_id == None and planet_id == None and vehicle_id == None:
+        return jsonify({"error": "Favorites must have at least one of these: planet_id, character_id, or vehicle_id"}), 400
+    values = {"user_id": user_id, "character_id": character_id, "planet_id": planet_id, "vehicle_id": vehicle_id}
+    if favorite_writer is not None:
+        #Se valida y se guarda en el proximo lote, el cliente consulta el ticket
+        ticket = favorite_writer.submit("create", values)
+        return jsonify({"ticket": ticket, "status": "pending"}), 202, {"Location": url_for('get_favorite_ticket', ticket=ticket)}
+    #Buscar si el usuario, character, planet y vehiculo existen en la tabla (una sola consulta)
+    user, character, planet, vehicle = db.session.query(
+        exists().where(User.id == user_id),
+        exists().where(Character.id == character_id),
+        exists().where(Planet.id == planet_id),
+        exists().where(Vehicle.id == vehicle_id)
+    ).one()
 
     errors=[]
-    if user is None:
+    if not user:
         errors.append(f"User with id: {user_id} not found")
-    if character_id is not None and character is None:
+    if character_id is not None and not character:
         errors.append(f"Character with id: {character_id} not found")
-    if planet_id is not None and planet is None:
+    if planet_id is not None and not planet:
         errors.append(f"Planet with id: {planet_id} not found")
-    if vehicle_id is not None and vehicle is None:
+    if vehicle_id is not None and not vehicle:
         errors.append(f"Vehicle with id: {vehicle_id} not found")
-    if character_id == None and vehicle_id==None and character_id==None:
-        return jsonify({"error": "Favorites must have at least one of these: planet_id, character_id, or vehicle_id"}), 400
     if errors:
         return jsonify({"error": " or ".join(errors)}), 404
-    
-    #Creando un favorite
-    new_favorite = Favorite(user, character, planet, vehicle)
-
-    db.session.add(new_favorite)
-    db.session.commit()
 
-    return jsonify(new_favorite.serialize()), 200
+    #Creando un favorite, si ya existe no se duplica (ON CONFLICT DO NOTHING)
+    result = db.session.execute(insert_ignore(Favorite).values(**values))
+    if result.rowcount == 1:
+        count_favorite(values, 1)
+        db.session.commit()
+        favorite_id = result.inserted_primary_key[0]
+    else:
+        db.session.commit()
+        favorite_id = Favorite.query.with_entities(Favorite.id).filter_by(**values).scalar()
+
+    return jsonify({
+        "id" : favorite_id,
+        "user": user_id,
+        "character" : character_id,
+        "planet" : planet_id,
+        "vehicle": vehicle_id
+    }), 200
+
+#BULK CREATE
+@app.route('/favorites/bulk', methods=['POST'])
+@login_required(optional=True)
+def new_favorites_bulk():
+
+    items = get_bulk_items()
+    #Una sola consulta IN por tabla para validar todos los ids del lote
+    users = find_existing(User.id, [item.get('user_id') for item in items if isinstance(item, dict)])
+    characters = find_existing(Character.id, [item.get('character_id') for item in items if isinstance(item, dict)])
+    planets = find_existing(Planet.id, [item.get('planet_id') for item in items if isinstance(item, dict)])
+    vehicles = find_existing(Vehicle.id, [item.get('vehicle_id') for item in items if isinstance(item, dict)])
+
+    rows = {}
+    errors = {}
+    for index, item in enumerate(items):
+        if missing_fields(item, ['user_id']):
+            errors[index] = "Missing user_id"
+            continue
+        if g.user_id is not None and item['user_id'] != g.user_id:
+            errors[index] = "You can only change your own favorites"
+            continue
+        character_id = item.get('character_id', None)
+        planet_id = item.get('planet_id', None)
+        vehicle_id = item.get('vehicle_id', None)
+        if character_id == None and planet_id == None and vehicle_id == None:
+            errors[index] = "Favorites must have at least one of these: planet_id, character_id, or vehicle_id"
+            continue
+        not_found = []
+        if item['user_id'] not in users:
+            not_found.append(f"User with id: {item['user_id']} not found")
+        if character_id is not None and character_id not in characters:
+            not_found.append(f"Character with id: {character_id} not found")
+        if planet_id is not None and planet_id not in planets:
+            not_found.append(f"Planet with id: {planet_id} not found")
+        if vehicle_id is not None and vehicle_id not in vehicles:
+            not_found.append(f"Vehicle with id: {vehicle_id} not found")
+        if not_found:
+            errors[index] = " or ".join(not_found)
+            continue
+        rows[index] = {"user_id": item['user_id'], "character_id": character_id, "planet_id": planet_id, "vehicle_id": vehicle_id}
+
+    #Los favoritos repetidos se ignoran en vez de fallar todo el lote
+    #y solo los que se insertaron suman a los contadores
+    return bulk_insert(Favorite, rows, errors, insert_rows=insert_favorites)
+
+#Estado de un POST/DELETE encolado con WRITE_BEHIND: pending, done o error
+@app.route('/favorites/tickets/<string:ticket>', methods=['GET'])
+def get_favorite_ticket(ticket):
+    result = favorite_writer.get_ticket(ticket) if favorite_writer is not None else None
+    if result is None:
+        return jsonify({"error": f"Ticket {ticket} not found (it expired or was never issued)"}), 404
+    return jsonify(dict(result, ticket=ticket)), 200
+
+#TOP - los mas marcados como favoritos
+@app.route('/favorites/top', methods=['GET'])
+@conditional('favorite', 'character', 'planet', 'vehicle')
+def get_top_favorites():
+    kind = request.args.get('kind', 'character')
+    if kind not in KINDS:
+        return jsonify({"error": f"kind must be one of: {', '.join(KINDS)}"}), 400
+    return jsonify({"results": top_favorites(kind, get_page_size())}), 200
 
 #DELETE
 @app.route('/favorites/<int:id>', methods=['DELETE'])
+@login_required(optional=True)
 def remove_favorite(id):
+    if favorite_writer is not None:
+        ticket = favorite_writer.submit("delete", {"id": id, "owner": g.user_id})
+        return jsonify({"ticket": ticket, "status": "pending"}), 202, {"Location": url_for('get_favorite_ticket', ticket=ticket)}
     searched_user = Favorite.query.filter_by(id=id).one_or_none()
     
     if searched_user is not None:
+        check_owner(searched_user.user_id)
         db.session.delete(searched_user)
+        count_favorite({"character_id": searched_user.character_id, "planet_id": searched_user.planet_id,
+                        "vehicle_id": searched_user.vehicle_id}, -1)
         db.session.commit()
         return jsonify(searched_user.serialize()), 202
     else:
@@ -178,17 +471,26 @@ def remove_favorite(id):
 
 #1.READ - query.all()
 @app.route('/planets', methods=['GET'])
+@conditional('planet')
 def get_planets():
 
-    planets = Planet.query.all()
-    planetas_serializados = [planeta.serialize() for planeta in planets]
-    return jsonify(planetas_serializados), 200
+    if wants_stream():
+        return stream_json(apply_filters(Planet.query, Planet), Planet)
+
+    planets, next_cursor = paginate(apply_filters(Planet.query, Planet), Planet)
+    return page_response(planets, next_cursor, Planet), 200
 
 @app.route('/planets/<int:id>', methods=['GET'])
+@conditional('planet')
 def get_planet(id):
 
-    searched_planet = Planet.query.filter_by(id=id).one_or_none()
-    planeta_serializado = searched_planet.serialize()
+    planeta_serializado = detail_cache.get('planet', id, g.table_versions['planet'])
+    if planeta_serializado is None:
+        searched_planet = Planet.query.filter_by(id=id).one_or_none()
+        if searched_planet is None:
+            return jsonify({"error": f"Planet with id: {id} not found"}), 404
+        planeta_serializado = searched_planet.serialize()
+        detail_cache.set('planet', id, g.table_versions['planet'], planeta_serializado)
     return jsonify(planeta_serializado), 200
 
 #2.CREATE
@@ -212,12 +514,35 @@ def add_planet():
 
         db.session.add(new_planet) #Memoria RAM
         db.session.commit() #Se guarda con las intruccion SQL CREATE
+        detail_cache.invalidate('planet', new_planet.id)
+        stats_cache.row_added(Planet, new_planet, committed_version('planet'))
 
         return jsonify({"msg": "success"}), 201
     
     except:
         return jsonify({"error" : "Something went wrong! That name has already been used" }), 500
 
+@app.route('/planets/bulk', methods = ['POST'])
+def add_planets_bulk():
+
+    items = get_bulk_items()
+    fields = ['name', 'density', 'diameter', 'orbital_period', 'population', 'weater']
+    used_names = find_existing(Planet.name, [item.get('name') for item in items if isinstance(item, dict)])
+
+    rows = {}
+    errors = {}
+    for index, item in enumerate(items):
+        missing = missing_fields(item, fields)
+        if missing:
+            errors[index] = "Missing fields: " + ", ".join(missing)
+        elif item['name'] in used_names:
+            errors[index] = f"That name has already been used: {item['name']}"
+        else:
+            used_names.add(item['name'])
+            rows[index] = {field: item[field] for field in fields}
+
+    return bulk_insert(Planet, rows, errors)
+
 #3.DELETE - delete()
 @app.route('/planets/<int:id>', methods = ['DELETE'])
 def remove_planets(id):
@@ -232,8 +557,21 @@ def remove_planets(id):
     else:
         db.session.delete(searched_planet)
         db.session.commit()
+        detail_cache.invalidate('planet', id)
+        stats_cache.row_removed(Planet, searched_planet, committed_version('planet'))
         return jsonify(searched_planet.serialize()), 202
 
+#BATCH DELETE - ?ids=1,2,3
+@app.route('/planets', methods = ['DELETE'])
+def remove_planets_batch():
+    ids = get_ids()
+    deleted, results = batch_delete(Planet, ids, [Character.planet_origin_id, Favorite.planet_id],
+                                    "Cannot delete planet. It is added to characters or favorites.")
+    for id in deleted:
+        detail_cache.invalidate('planet', id)
+    return jsonify({"deleted": len(deleted), "failed": len(ids) - len(deleted), "results": results}), 200
+
+
 
 
 
@@ -243,17 +581,36 @@ def remove_planets(id):
 
 #CRUD FOR CHARACTERS
 @app.route('/characters', methods=['GET'])
+@conditional('character', 'planet', 'vehicle')
 def get_characters():
 
-    characters = Character.query.all()
-    personajes_serializados = [personaje.serialize() for personaje in characters]
-    return jsonify(personajes_serializados), 200
+    expand = get_expand(Character)
+    query = apply_filters(Character.query, Character).options(*expand_options(Character, expand))
+    if wants_stream():
+        return stream_json(query, Character, expand=expand)
+
+    characters, next_cursor = paginate(query, Character)
+    return page_response(characters, next_cursor, Character, expand=expand), 200
 
 @app.route('/characters/<int:id>', methods=['GET'])
+@conditional('character', 'planet', 'vehicle')
 def get_character(id):
 
-    searched_character = Character.query.filter_by(id=id).one_or_none()
-    personaje_serializado = searched_character.serialize()
+    expand = get_expand(Character)
+    if expand:
+        #Con expand no se usa el cache, solo guarda la version sin relaciones
+        searched_character = Character.query.options(*expand_options(Character, expand)).filter_by(id=id).one_or_none()
+        if searched_character is None:
+            return jsonify({"error": f"Character with id: {id} not found"}), 404
+        return jsonify(searched_character.serialize(expand=expand)), 200
+
+    personaje_serializado = detail_cache.get('character', id, g.table_versions['character'])
+    if personaje_serializado is None:
+        searched_character = Character.query.filter_by(id=id).one_or_none()
+        if searched_character is None:
+            return jsonify({"error": f"Character with id: {id} not found"}), 404
+        personaje_serializado = searched_character.serialize()
+        detail_cache.set('character', id, g.table_versions['character'], personaje_serializado)
     return jsonify(personaje_serializado), 200
 
 #2.CREATE
@@ -281,9 +638,38 @@ def add_character():
 
     db.session.add(new_character)
     db.session.commit()
+    detail_cache.invalidate('character', new_character.id)
+    stats_cache.row_added(Character, new_character, committed_version('character'))
 
     return jsonify(new_character.serialize()), 200
 
+@app.route('/characters/bulk', methods = ['POST'])
+def add_characters_bulk():
+
+    items = get_bulk_items()
+    fields = ['name', 'height', 'weight', 'planet_id', 'vehicle_id']
+    valid_items = [item for item in items if isinstance(item, dict)]
+    used_names = find_existing(Character.name, [item.get('name') for item in valid_items])
+    planets = find_existing(Planet.id, [item.get('planet_id') for item in valid_items])
+    vehicles = find_existing(Vehicle.id, [item.get('vehicle_id') for item in valid_items])
+
+    rows = {}
+    errors = {}
+    for index, item in enumerate(items):
+        missing = missing_fields(item, fields)
+        if missing:
+            errors[index] = "Missing fields: " + ", ".join(missing)
+        elif item['planet_id'] not in planets or item['vehicle_id'] not in vehicles:
+            errors[index] = f"Planet with id: {item['planet_id']} or Vehicle with id: {item['vehicle_id']} not found"
+        elif item['name'] in used_names:
+            errors[index] = f"That name has already been used: {item['name']}"
+        else:
+            used_names.add(item['name'])
+            rows[index] = {"name": item['name'], "height": item['height'], "weight": item['weight'],
+                           "planet_origin_id": item['planet_id'], "vehicle_id": item['vehicle_id']}
+
+    return bulk_insert(Character, rows, errors)
+
 #DELETE
 @app.route('/characters/<int:id>', methods=['DELETE'])
 def remove_character(id):
@@ -297,22 +683,43 @@ def remove_character(id):
     else:
         db.session.delete(searched_character)
         db.session.commit()
+        detail_cache.invalidate('character', id)
+        stats_cache.row_removed(Character, searched_character, committed_version('character'))
         return jsonify(searched_character.serialize()), 202
 
 
+#BATCH DELETE - ?ids=1,2,3
+@app.route('/characters', methods = ['DELETE'])
+def remove_characters_batch():
+    ids = get_ids()
+    deleted, results = batch_delete(Character, ids, [Favorite.character_id],
+                                    "Cannot delete character. It is added to favorites.")
+    for id in deleted:
+        detail_cache.invalidate('character', id)
+    return jsonify({"deleted": len(deleted), "failed": len(ids) - len(deleted), "results": results}), 200
+
 #CRUD FOR VEHICLES
 @app.route('/vehicles', methods=['GET'])
+@conditional('vehicle')
 def get_vehicles():
 
-    vehicles = Vehicle.query.all()
-    vehiculos_serializados = [vehiculo.serialize() for vehiculo in vehicles]
-    return jsonify(vehiculos_serializados), 200
+    if wants_stream():
+        return stream_json(apply_filters(Vehicle.query, Vehicle), Vehicle)
+
+    vehicles, next_cursor = paginate(apply_filters(Vehicle.query, Vehicle), Vehicle)
+    return page_response(vehicles, next_cursor, Vehicle), 200
 
 @app.route('/vehicles/<int:id>', methods=['GET'])
+@conditional('vehicle')
 def get_vehicle(id):
     
-    searched_vehicle = Vehicle.query.filter_by(id=id).one_or_none()
-    vehiculo_serializado = searched_vehicle.serialize()
+    vehiculo_serializado = detail_cache.get('vehicle', id, g.table_versions['vehicle'])
+    if vehiculo_serializado is None:
+        searched_vehicle = Vehicle.query.filter_by(id=id).one_or_none()
+        if searched_vehicle is None:
+            return jsonify({"error": f"Vehicle with id: {id} not found"}), 404
+        vehiculo_serializado = searched_vehicle.serialize()
+        detail_cache.set('vehicle', id, g.table_versions['vehicle'], vehiculo_serializado)
     return jsonify(vehiculo_serializado), 200
 
 #2.CREATE
@@ -335,12 +742,35 @@ def add_vehicle():
 
         db.session.add(new_vehicle) #Memoria RAM
         db.session.commit() #Se guarda con las intruccion SQL CREATE
+        detail_cache.invalidate('vehicle', new_vehicle.id)
+        stats_cache.row_added(Vehicle, new_vehicle, committed_version('vehicle'))
 
         return jsonify({"msg": "success"}), 201
     
     except:
         return jsonify({"error" : "Something went wrong! That name has already been used" }), 500
 
+@app.route('/vehicles/bulk', methods = ['POST'])
+def add_vehicles_bulk():
+
+    items = get_bulk_items()
+    fields = ['name', 'cargo_capacity', 'crew', 'model', 'passengers']
+    used_names = find_existing(Vehicle.name, [item.get('name') for item in items if isinstance(item, dict)])
+
+    rows = {}
+    errors = {}
+    for index, item in enumerate(items):
+        missing = missing_fields(item, fields)
+        if missing:
+            errors[index] = "Missing fields: " + ", ".join(missing)
+        elif item['name'] in used_names:
+            errors[index] = f"That name has already been used: {item['name']}"
+        else:
+            used_names.add(item['name'])
+            rows[index] = {field: item[field] for field in fields}
+
+    return bulk_insert(Vehicle, rows, errors)
+
 #3.DELETE - delete()
 @app.route('/vehicles/<int:id>', methods = ['DELETE'])
 def remove_vehicles(id):
@@ -355,12 +785,42 @@ def remove_vehicles(id):
     else:
         db.session.delete(searched_vehicle)
         db.session.commit()
+        detail_cache.invalidate('vehicle', id)
+        stats_cache.row_removed(Vehicle, searched_vehicle, committed_version('vehicle'))
         return jsonify(searched_vehicle.serialize()), 202
 
+#BATCH DELETE - ?ids=1,2,3
+@app.route('/vehicles', methods = ['DELETE'])
+def remove_vehicles_batch():
+    ids = get_ids()
+    deleted, results = batch_delete(Vehicle, ids, [Character.vehicle_id, Favorite.vehicle_id],
+                                    "Cannot delete vehicle. It is added to characters or favorites.")
+    for id in deleted:
+        detail_cache.invalidate('vehicle', id)
+    return jsonify({"deleted": len(deleted), "failed": len(ids) - len(deleted), "results": results}), 200
+
+
+
+
 
 
 
+#Recalcula la tabla favorite_count desde cero: flask rebuild-favorite-counts
+@app.cli.command("rebuild-favorite-counts")
+def rebuild_favorite_counts_command():
+    rebuild_favorite_counts()
+    print("Favorite counts rebuilt")
 
+#Carga un dump de planets, vehicles, characters y favorites: flask import-catalog catalog.ndjson
+@app.cli.command("import-catalog")
+@click.argument("file", type=click.Path(exists=True, dir_okay=False))
+@click.option("--format", "file_format", type=click.Choice(["json", "ndjson"]), default=None,
+              help="By default ndjson for .ndjson/.jsonl files, json for the rest")
+@click.option("--chunk-size", default=1000, show_default=True, help="Rows per INSERT and commit")
+@click.option("--resume", is_flag=True, help="Go on from the last chunk of a failed import")
+def import_catalog_command(file, file_format, chunk_size, resume):
+    errors = CatalogImporter(file, file_format=file_format, chunk_size=chunk_size, resume=resume).run()
+    print(f"Catalog imported, {errors} records skipped" if errors else "Catalog imported")
 
 # this only runs if `$ python src/app.py` is executed
 if __name__ == '__main__':
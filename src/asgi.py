@@ -0,0 +1,146 @@
+"""
+ASGI entry point. The plain catalog reads (GET /planets, /vehicles,
+/characters, /user with ?limit=&after= and GET /<resource>/<id>) run on the
+async SQLAlchemy engine (asyncpg / aiosqlite) so a slow database round trip
+does not block a worker. Every other request is passed to the Flask app
+of wsgi.py, which keeps working as before.
+
+    $ uvicorn asgi:application --app-dir src
+    $ gunicorn asgi:application -k uvicorn.workers.UvicornWorker --chdir ./src/
+"""
+import os
+import re
+from urllib.parse import parse_qs
+from asgiref.wsgi import WsgiToAsgi
+from sqlalchemy import select
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from werkzeug.http import parse_etags, quote_etag
+from app import app, detail_cache
+from models import User, Character, Planet, Vehicle, TableVersion
+from utils import APIException, encode_cursor, cursor_position, sort_key, make_etag
+
+# resource -> (model, tables of its ETag, same as the @conditional of app.py)
+RESOURCES = {
+    "user": (User, ("user",)),
+    "planets": (Planet, ("planet",)),
+    "vehicles": (Vehicle, ("vehicle",)),
+    "characters": (Character, ("character", "planet", "vehicle"))
+}
+ROUTE = re.compile(r"^/(user|planets|vehicles|characters)(?:/(\d+))?/?$")
+ASYNC_ARGS = {"limit", "after"}
+
+def get_async_database_url(url):
+    url = url.replace("postgres://", "postgresql://")
+    if url.startswith("postgresql://"):
+        return url.replace("postgresql://", "postgresql+asyncpg://", 1)
+    if url.startswith("sqlite://"):
+        return url.replace("sqlite://", "sqlite+aiosqlite://", 1)
+    return url
+
+def get_async_engine_options(database_uri):
+    options = {"pool_pre_ping": app.config['SQLALCHEMY_ENGINE_OPTIONS'].get("pool_pre_ping", True)}
+    if not database_uri.startswith("sqlite"):
+        for name in ("pool_size", "max_overflow", "pool_timeout", "pool_recycle"):
+            if name in app.config['SQLALCHEMY_ENGINE_OPTIONS']:
+                options[name] = app.config['SQLALCHEMY_ENGINE_OPTIONS'][name]
+    statement_timeout = os.getenv("DB_STATEMENT_TIMEOUT", None)
+    if statement_timeout and database_uri.startswith("postgresql"):
+        options["connect_args"] = {"server_settings": {"statement_timeout": str(int(statement_timeout))}}
+    return options
+
+database_uri = app.config['SQLALCHEMY_DATABASE_URI']
+engine = create_async_engine(get_async_database_url(database_uri), **get_async_engine_options(database_uri))
+Session = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+wsgi_application = WsgiToAsgi(app)
+
+def get_page_size(args):
+    max_size = app.config.get('MAX_PAGE_SIZE', 100)
+    if "limit" not in args:
+        return max_size
+    try:
+        limit = int(args["limit"][0])
+    except ValueError:
+        raise APIException(f"Invalid limit: {args['limit'][0]}", status_code=400)
+    if limit < 1:
+        raise APIException("limit must be greater than 0", status_code=400)
+    return min(limit, max_size)
+
+async def get_versions(session, tables):
+    rows = await session.execute(select(TableVersion.name, TableVersion.version).where(TableVersion.name.in_(tables)))
+    versions = dict(rows.all())
+    return [versions.get(table, 0) for table in tables]
+
+async def read_list(session, model, tables, args):
+    limit = get_page_size(args)
+    query = select(model)
+    # Same cursors as utils.paginate without ?sort=
+    sort = (model.id, False)
+    if "after" in args:
+        value, last_id = cursor_position(args["after"][0], model, sort)
+        query = query.where(model.id > last_id)
+    rows = (await session.execute(query.order_by(model.id).limit(limit + 1))).scalars().all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([sort_key(sort), rows[-1].id, rows[-1].id])
+    dumps = app.json.dumps
+    fragment_cache = app.extensions.get('fragment_cache', None)
+    if fragment_cache is not None:
+        results = fragment_cache.encode(model.__tablename__, rows, dumps)
+    else:
+        results = [dumps(row.serialize()) for row in rows]
+    return 200, '{"next":' + dumps(next_cursor) + ',"results":[' + ",".join(results) + ']}'
+
+async def read_detail(session, model, id, version):
+    table = model.__tablename__
+    data = detail_cache.get(table, id, version)
+    if data is None:
+        row = await session.get(model, id)
+        if row is None:
+            return 404, app.json.dumps({"error": f"{model.__name__} with id: {id} not found"})
+        data = row.serialize()
+        detail_cache.set(table, id, version, data)
+    return 200, app.json.dumps(data)
+
+async def send(asgi_send, status, body, etag=None):
+    headers = [(b"content-type", b"application/json"), (b"access-control-allow-origin", b"*")]
+    if etag is not None:
+        headers.append((b"etag", quote_etag(etag).encode()))
+    await asgi_send({"type": "http.response.start", "status": status, "headers": headers})
+    await asgi_send({"type": "http.response.body", "body": body.encode() if isinstance(body, str) else body})
+
+async def lifespan(receive, asgi_send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await asgi_send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await engine.dispose()
+            await asgi_send({"type": "lifespan.shutdown.complete"})
+            return
+
+async def application(scope, receive, asgi_send):
+    if scope["type"] == "lifespan":
+        return await lifespan(receive, asgi_send)
+    match = ROUTE.match(scope["path"]) if scope["type"] == "http" and scope["method"] == "GET" else None
+    args = parse_qs(scope.get("query_string", b"").decode()) if match else {}
+    if match is None or not set(args) <= ASYNC_ARGS or (match.group(2) and args):
+        return await wsgi_application(scope, receive, asgi_send)
+
+    model, tables = RESOURCES[match.group(1)]
+    headers = dict(scope["headers"])
+    full_path = scope["path"] + "?" + scope.get("query_string", b"").decode()
+    try:
+        async with Session() as session:
+            versions = await get_versions(session, tables)
+            etag = make_etag(versions, full_path)
+            if parse_etags(headers.get(b"if-none-match", b"").decode()).contains(etag):
+                return await send(asgi_send, 304, b"", etag)
+            if match.group(2):
+                status, body = await read_detail(session, model, int(match.group(2)), versions[0])
+            else:
+                status, body = await read_list(session, model, tables, args)
+    except APIException as error:
+        return await send(asgi_send, error.status_code, app.json.dumps(error.to_dict()))
+    await send(asgi_send, status, body, etag if status == 200 else None)
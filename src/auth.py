@@ -0,0 +1,159 @@
+import os
+import hmac
+import json
+import time
+import base64
+import hashlib
+import secrets
+import threading
+from functools import wraps
+from concurrent.futures import ThreadPoolExecutor
+from flask import request, current_app, g
+from werkzeug.security import generate_password_hash, check_password_hash
+from models import db, RevokedToken
+from utils import APIException
+
+# Password hashing is slow on purpose (~60 ms of pbkdf2). It runs in a small
+# pool: hashlib releases the GIL, so the other threads of the worker keep
+# serving, and a burst of logins can use at most AUTH_HASH_THREADS cores
+hash_pool = ThreadPoolExecutor(max_workers=int(os.getenv("AUTH_HASH_THREADS", 2)), thread_name_prefix="password-hash")
+
+HASH_PREFIXES = ("pbkdf2:", "scrypt:")
+
+def hash_password(password):
+    return hash_pool.submit(generate_password_hash, password).result()
+
+# Hash of a random password, checked when there is no hash to check, so a
+# login takes as long whether the user exists or not. Made on first use
+dummy_hash = None
+
+def get_dummy_hash():
+    global dummy_hash
+    if dummy_hash is None:
+        dummy_hash = hash_password(secrets.token_hex(16))
+    return dummy_hash
+
+def check_password(stored, password):
+    """True if `password` matches the stored hash. Passwords saved before
+    hashing was added are compared as plain text: the caller rehashes them
+    when they match, and a dummy hash is checked when they do not, so both
+    cost one hash."""
+    if not stored.startswith(HASH_PREFIXES):
+        if hmac.compare_digest(stored.encode(), password.encode()):
+            return True
+        hash_pool.submit(check_password_hash, get_dummy_hash(), password).result()
+        return False
+    return hash_pool.submit(check_password_hash, stored, password).result()
+
+def check_login(user, password):
+    """True if `user` exists, is active and `password` is its password. A
+    missing or inactive user still costs one hash check, so the time of the
+    answer does not tell which usernames exist."""
+    if user is None or not user.is_active:
+        hash_pool.submit(check_password_hash, get_dummy_hash(), password).result()
+        return False
+    return check_password(user.password, password)
+
+def needs_rehash(stored):
+    return not stored.startswith(HASH_PREFIXES)
+
+def b64encode(data):
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+def b64decode(data):
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+def sign(payload):
+    key = current_app.config["SECRET_KEY"].encode()
+    return b64encode(hmac.new(key, payload.encode(), hashlib.sha256).digest())
+
+def issue_token(user_id, ttl=None):
+    """Signed token for `user_id`: base64(claims).base64(HMAC-SHA256). It
+    carries everything needed to check it, so no table is read."""
+    ttl = ttl if ttl is not None else current_app.config["AUTH_TOKEN_TTL"]
+    claims = {"sub": user_id, "exp": int(time.time()) + ttl, "jti": secrets.token_hex(8)}
+    payload = b64encode(json.dumps(claims, separators=(",", ":")).encode())
+    return f"{payload}.{sign(payload)}", claims
+
+def verify_token(token):
+    """Claims of a valid token, or None when it is malformed, forged,
+    expired or revoked."""
+    payload, _, signature = token.partition(".")
+    if not signature or not hmac.compare_digest(sign(payload), signature):
+        return None
+    try:
+        claims = json.loads(b64decode(payload))
+    except ValueError:
+        return None
+    if not isinstance(claims, dict) or not isinstance(claims.get("exp", None), int) or "sub" not in claims:
+        return None
+    if claims["exp"] < time.time():
+        return None
+    if current_app.extensions["revoked_tokens"].is_revoked(claims.get("jti", None)):
+        return None
+    return claims
+
+class RevocationList:
+    """jti of the revoked tokens that did not expire yet, cached in memory and
+    reloaded from the revoked_token table every `ttl` seconds, so other
+    workers see a logout after at most `ttl` seconds."""
+
+    def __init__(self, ttl=30):
+        self.ttl = ttl
+        self.revoked = {}
+        self.loaded_at = None
+        self.lock = threading.Lock()
+
+    def is_revoked(self, jti):
+        now = time.monotonic()
+        if self.loaded_at is None or now - self.loaded_at > self.ttl:
+            self.reload()
+        return jti in self.revoked
+
+    def reload(self):
+        now = int(time.time())
+        rows = db.session.query(RevokedToken.jti, RevokedToken.expires_at).filter(RevokedToken.expires_at >= now)
+        revoked = dict(rows)
+        with self.lock:
+            self.revoked = revoked
+            self.loaded_at = time.monotonic()
+
+    def revoke(self, claims):
+        """Store the revocation and apply it right away in this process. It is
+        committed by the caller."""
+        now = int(time.time())
+        # The expired ones are not needed anymore
+        RevokedToken.query.filter(RevokedToken.expires_at < now).delete(synchronize_session=False)
+        db.session.merge(RevokedToken(claims["jti"], claims["exp"]))
+        with self.lock:
+            self.revoked[claims["jti"]] = claims["exp"]
+
+def get_token_claims():
+    header = request.headers.get("Authorization", "")
+    scheme, _, token = header.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    return verify_token(token.strip())
+
+def login_required(optional=False):
+    """Require a valid Bearer token and put its user id in g.user_id. With
+    optional=True the token is only required when REQUIRE_AUTH is on."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            claims = get_token_claims()
+            if claims is None:
+                if optional and not current_app.config["REQUIRE_AUTH"]:
+                    g.user_id = None
+                    return func(*args, **kwargs)
+                raise APIException("Missing, invalid or expired token", status_code=401)
+            g.user_id = claims["sub"]
+            g.token_claims = claims
+            return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def check_owner(user_id):
+    """403 when the request is authenticated as another user."""
+    if g.get("user_id", None) is not None and g.user_id != user_id:
+        raise APIException("You can only change your own favorites", status_code=403)
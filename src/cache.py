@@ -0,0 +1,110 @@
+import time
+import threading
+from collections import OrderedDict
+
+class DetailCache:
+    """In-process LRU cache with TTL for serialized rows, keyed by (table, id).
+    Each entry keeps the table version it was read at, and a get with
+    another version is a miss: writes made by other workers (or the admin)
+    bump the version, so they are never served from here."""
+
+    def __init__(self, max_size=1024, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, table, id, version):
+        key = (table, id)
+        with self.lock:
+            entry = self.entries.get(key, None)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, cached_version, value = entry
+            if expires_at < time.monotonic() or cached_version != version:
+                del self.entries[key]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, table, id, version, value):
+        if self.max_size <= 0:
+            return
+        key = (table, id)
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, version, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, table, id):
+        with self.lock:
+            self.entries.pop((table, id), None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            return {
+                "size": len(self.entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
+
+
+class FragmentCache:
+    """Encoded JSON of each row's serialize(), keyed by (table, id) and valid
+    while the row keeps the same row_version, so list responses are mostly
+    a string join. Writes to other rows of the table do not touch it."""
+
+    def __init__(self, max_size=100000):
+        self.max_size = max_size
+        self.fragments = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def encode(self, table, rows, dumps):
+        """JSON strings of `rows`, in the same order."""
+        if self.max_size <= 0:
+            return [dumps(row.serialize()) for row in rows]
+        found = []
+        with self.lock:
+            for row in rows:
+                entry = self.fragments.get((table, row.id), None)
+                found.append(entry[1] if entry is not None and entry[0] == row.row_version else None)
+
+        missing = {}
+        for i, row in enumerate(rows):
+            if found[i] is None:
+                found[i] = dumps(row.serialize())
+                missing[(table, row.id)] = (row.row_version, found[i])
+
+        with self.lock:
+            self.hits += len(rows) - len(missing)
+            self.misses += len(missing)
+            self.fragments.update(missing)
+            while len(self.fragments) > self.max_size:
+                self.fragments.popitem(last=False)
+        return found
+
+    def stats(self):
+        with self.lock:
+            return {
+                "size": len(self.fragments),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses
+            }
@@ -0,0 +1,253 @@
+import os
+import json
+import time
+from models import db, User, Planet, Vehicle, Character, Favorite
+from utils import missing_fields, insert_ignore
+from leaderboard import insert_favorites
+
+# Import order: a pass over the file for each group, so every reference
+# points to a row that is already stored
+PASSES = (("planet", "vehicle"), ("character",), ("favorite",))
+MODELS = {"planet": Planet, "vehicle": Vehicle, "character": Character, "favorite": Favorite}
+KIND_NAMES = {
+    "planet": "planet", "planets": "planet",
+    "vehicle": "vehicle", "vehicles": "vehicle",
+    "character": "character", "characters": "character", "people": "character",
+    "favorite": "favorite", "favorites": "favorite"
+}
+FIELDS = {
+    "planet": ["name", "density", "diameter", "orbital_period", "population", "weater"],
+    "vehicle": ["name", "cargo_capacity", "crew", "model", "passengers"],
+    "character": ["name", "height", "weight"]
+}
+
+class JSONStream:
+    """Reads the values of a JSON document one at a time, without loading
+    the whole file."""
+
+    def __init__(self, file, chunk_size=1 << 16):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        # What was already read is dropped, the buffer only holds the value
+        # being read and the chunk after it
+        data = self.file.read(self.chunk_size)
+        if not data:
+            self.eof = True
+        self.buffer = self.buffer[self.pos:] + data
+        self.pos = 0
+
+    def peek(self):
+        """Next character that is not whitespace, or "" at the end."""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos].isspace():
+                self.pos += 1
+            if self.pos < len(self.buffer) or self.eof:
+                return self.buffer[self.pos:self.pos + 1]
+            self.fill()
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"Expected {char!r} in the catalog file, found {self.peek()!r}")
+        self.pos += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                # A number cut by the end of the buffer ("3." of "3.5") may continue in the next chunk
+                cut = (isinstance(value, (int, float)) and not isinstance(value, bool)
+                       and (end == len(self.buffer) or self.buffer[end] in ".eE+-"))
+                if self.eof or not cut:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self.fill()
+
+    def items(self):
+        """Values of the array that starts at the current position."""
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.peek() == ",":
+                self.pos += 1
+                continue
+            self.expect("]")
+            return
+
+def record_kind(record):
+    """Kind named by the "type" of `record`, None when it has none (or it
+    is not an object)."""
+    if not isinstance(record, dict):
+        return None
+    return KIND_NAMES.get(record.get("type", None), None)
+
+def read_records(path, file_format, chunk_size=1 << 16):
+    """(kind, record) of every record of the file. The file is one of:
+    - ndjson: one object per line, with "type"
+    - json: an array of objects with "type"
+    - json: an object of arrays, like {"planets": [...], "characters": [...]}"""
+    with open(path, encoding="utf-8") as file:
+        if file_format == "ndjson":
+            for line in file:
+                if line.strip():
+                    record = json.loads(line)
+                    yield record_kind(record), record
+            return
+        stream = JSONStream(file, chunk_size)
+        if stream.peek() == "[":
+            for record in stream.items():
+                yield record_kind(record), record
+            return
+        stream.expect("{")
+        while stream.peek() != "}":
+            key = stream.value()
+            stream.expect(":")
+            for record in stream.items():
+                yield KIND_NAMES.get(key, None), record
+            if stream.peek() == ",":
+                stream.pos += 1
+        stream.expect("}")
+
+def reference_value(reference, record):
+    return record.get(reference, record.get(f"{reference}_id", None))
+
+def name_map(model):
+    """name -> id of every row of `model`."""
+    return {name: id for id, name in db.session.query(model.id, model.name).yield_per(10000)}
+
+class CatalogImporter:
+    """Loads a catalog dump with chunked INSERT ... ON CONFLICT DO NOTHING,
+    committing each chunk. The number of records done of each kind is saved
+    in a progress file after every chunk, so an import that failed can go on
+    with `resume` and rows inserted twice are ignored."""
+
+    def __init__(self, path, file_format=None, chunk_size=1000, resume=False, log=print):
+        self.path = path
+        if file_format is None:
+            file_format = "ndjson" if path.endswith((".ndjson", ".jsonl")) else "json"
+        self.file_format = file_format
+        self.chunk_size = chunk_size
+        self.progress_path = path + ".progress"
+        self.log = log
+        self.progress = {kind: 0 for kind in MODELS}
+        if resume and os.path.exists(self.progress_path):
+            with open(self.progress_path) as progress_file:
+                self.progress.update(json.load(progress_file))
+        self.errors = 0
+        self.names = {}
+        self.ids = {}
+
+    def run(self):
+        for kinds in PASSES:
+            self.import_pass(kinds)
+        if os.path.exists(self.progress_path):
+            os.remove(self.progress_path)
+        return self.errors
+
+    def import_pass(self, kinds):
+        if "character" in kinds:
+            self.names = {"planet": name_map(Planet), "vehicle": name_map(Vehicle)}
+        elif "favorite" in kinds:
+            self.names = {"user": {username: id for id, username in db.session.query(User.id, User.username)},
+                          "character": name_map(Character), "planet": name_map(Planet), "vehicle": name_map(Vehicle)}
+        self.ids = {reference: set(names.values()) for reference, names in self.names.items()}
+
+        seen = {kind: 0 for kind in kinds}
+        pending = {kind: [] for kind in kinds}
+        done = {kind: 0 for kind in kinds}
+        start = time.perf_counter()
+        for number, (kind, record) in enumerate(read_records(self.path, self.file_format), 1):
+            if kind is None and kinds == PASSES[0]:
+                self.error("record", number, "unknown type" if isinstance(record, dict) else "not an object")
+            if kind not in seen:
+                continue
+            seen[kind] += 1
+            # Already committed by the import that is being resumed
+            if seen[kind] <= self.progress[kind]:
+                continue
+            row = self.to_row(kind, record, seen[kind])
+            if row is not None:
+                pending[kind].append(row)
+            if seen[kind] - self.progress[kind] >= self.chunk_size:
+                done[kind] += self.flush(kind, pending[kind], seen[kind])
+                pending[kind] = []
+        for kind in kinds:
+            done[kind] += self.flush(kind, pending[kind], seen[kind])
+
+        elapsed = time.perf_counter() - start
+        counts = ", ".join(f"{done[kind]:,} {kind}" for kind in kinds)
+        self.log(f"{counts} rows in {elapsed:.1f} s ({sum(done.values()) / max(elapsed, 1e-9):,.0f} rows/s)")
+
+    def flush(self, kind, rows, seen):
+        if seen == self.progress[kind]:
+            return 0
+        if kind == "favorite" and rows:
+            insert_favorites(rows)
+        elif rows:
+            db.session.execute(insert_ignore(MODELS[kind]), rows)
+        db.session.commit()
+        self.progress[kind] = seen
+        with open(self.progress_path, "w") as progress_file:
+            json.dump(self.progress, progress_file)
+        return len(rows)
+
+    def to_row(self, kind, record, number):
+        """Column values of `record`, or None (and the error is logged) when
+        it is not valid."""
+        if not isinstance(record, dict):
+            return self.error(kind, number, "not an object")
+        if kind == "favorite":
+            return self.favorite_row(record, number)
+        missing = missing_fields(record, FIELDS[kind])
+        if missing:
+            return self.error(kind, number, "missing fields: " + ", ".join(missing))
+        row = {field: record[field] for field in FIELDS[kind]}
+        if kind == "character":
+            for reference in ("planet", "vehicle"):
+                id = self.resolve(reference, record)
+                if id is None:
+                    return self.error(kind, number, f"{reference} not found: {reference_value(reference, record)}")
+                row["planet_origin_id" if reference == "planet" else "vehicle_id"] = id
+        return row
+
+    def favorite_row(self, record, number):
+        user_id = self.resolve("user", record)
+        if user_id is None:
+            return self.error("favorite", number, f"user not found: {reference_value('user', record)}")
+        row = {"user_id": user_id, "character_id": None, "planet_id": None, "vehicle_id": None}
+        for reference in ("character", "planet", "vehicle"):
+            if record.get(reference, None) is None and record.get(f"{reference}_id", None) is None:
+                continue
+            id = self.resolve(reference, record)
+            if id is None:
+                return self.error("favorite", number, f"{reference} not found: {reference_value(reference, record)}")
+            row[f"{reference}_id"] = id
+        if row["character_id"] is None and row["planet_id"] is None and row["vehicle_id"] is None:
+            return self.error("favorite", number, "needs a character, planet or vehicle")
+        return row
+
+    def resolve(self, reference, record):
+        """Id of the row named by record[reference] (username for users) or
+        given in record[reference + "_id"], None if there is no such row."""
+        id = record.get(f"{reference}_id", None)
+        if id is not None:
+            return id if id in self.ids[reference] else None
+        return self.names[reference].get(record.get(reference, None), None)
+
+    def error(self, kind, number, message):
+        self.errors += 1
+        if self.errors <= 20:
+            self.log(f"Skipped {kind} #{number}: {message}")
+        return None
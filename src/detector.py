@@ -0,0 +1,91 @@
+import re
+import time
+import threading
+from collections import Counter
+from flask import request, jsonify, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+MODES = ("off", "log", "raise")
+
+# Parts of a statement that change between calls of the same query
+IN_LIST = re.compile(r"\((?:\s*(?:\?|%\(\w+\)s|:\w+)\s*,)+\s*(?:\?|%\(\w+\)s|:\w+)\s*\)")
+NUMBER = re.compile(r"\b\d+\b")
+SPACES = re.compile(r"\s+")
+
+def statement_shape(statement):
+    """The statement with IN lists and numbers collapsed, so the same query
+    with other ids has the same shape."""
+    shape = IN_LIST.sub("(?)", statement)
+    shape = NUMBER.sub("N", shape)
+    return SPACES.sub(" ", shape).strip()
+
+class QueryDetector:
+    """Watches the SQL of every request. It reports:
+    - statement shapes repeated `repeat_threshold` times or more (N+1)
+    - statements slower than `slow_ms`
+    - requests with more than `max_statements` statements (0 = no limit)
+
+    In "log" mode it writes warnings to app.logger. In "raise" mode, meant
+    for tests and staging, the request also fails with a 500 that lists the
+    problems."""
+
+    def __init__(self, mode="off", repeat_threshold=5, slow_ms=100, max_statements=0):
+        if mode not in MODES:
+            raise ValueError(f"QUERY_DETECTOR must be one of: {', '.join(MODES)}")
+        self.mode = mode
+        self.repeat_threshold = repeat_threshold
+        self.slow_ms = slow_ms
+        self.max_statements = max_statements
+        self.current = threading.local()
+        self.logger = None
+
+    def init_app(self, app):
+        if self.mode == "off":
+            return
+        self.logger = app.logger
+        app.before_request(self.before_request)
+        app.after_request(self.after_request)
+        event.listen(Engine, "before_cursor_execute", self.before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", self.after_cursor_execute)
+
+    def before_request(self):
+        self.current.shapes = Counter()
+        self.current.problems = []
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("detector_start", []).append(time.perf_counter())
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed_ms = (time.perf_counter() - conn.info["detector_start"].pop()) * 1000
+        shapes = getattr(self.current, "shapes", None)
+        if shapes is None or not has_request_context():
+            return
+        shapes[statement_shape(statement)] += 1
+        if elapsed_ms >= self.slow_ms:
+            self.report(f"Slow query ({elapsed_ms:.1f} ms): {statement}")
+
+    def after_request(self, response):
+        shapes = getattr(self.current, "shapes", None)
+        if shapes is None:
+            return response
+        self.current.shapes = None
+        for shape, count in shapes.most_common():
+            if count < self.repeat_threshold:
+                break
+            self.report(f"N+1: the same query ran {count} times: {shape}")
+        total = sum(shapes.values())
+        if self.max_statements and total > self.max_statements:
+            self.report(f"{total} queries in one request (limit {self.max_statements})")
+
+        problems = self.current.problems
+        if problems and self.mode == "raise":
+            response = jsonify({"error": "Query problems detected", "problems": problems})
+            response.status_code = 500
+        return response
+
+    def report(self, problem):
+        rule = request.url_rule
+        route = f"{request.method} {rule.rule if rule is not None else request.path}"
+        self.current.problems.append(problem)
+        self.logger.warning("%s: %s", route, problem)
@@ -0,0 +1,66 @@
+import io
+import csv
+import zlib
+from flask import Response, current_app, stream_with_context
+from sqlalchemy import select
+from models import db, User, Planet, Vehicle, Character, Favorite
+
+# resource of the url -> model
+EXPORTS = {
+    "users": User,
+    "planets": Planet,
+    "vehicles": Vehicle,
+    "characters": Character,
+    "favorites": Favorite
+}
+FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv"
+}
+
+def export_columns(model):
+    # row_version is only for the caches of the API
+    private = getattr(model, "PRIVATE", ()) + ("row_version",)
+    return [column for column in model.__table__.c if column.name not in private]
+
+def encode_ndjson(keys, rows):
+    dumps = current_app.json.dumps
+    return "".join(dumps(dict(zip(keys, row))) + "\n" for row in rows)
+
+def encode_csv(keys, rows):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue()
+
+def export_table(model, file_format, since_id=0, gzip=False, chunk_size=5000):
+    """Stream every row of `model` with id > since_id, ordered by id, as
+    NDJSON or CSV. Rows come as Core tuples from a server-side cursor, no
+    ORM objects are built and memory does not grow with the table."""
+    columns = export_columns(model)
+    keys = [column.name for column in columns]
+    statement = select(*columns).where(model.id > since_id).order_by(model.id)
+    encode = encode_ndjson if file_format == "ndjson" else encode_csv
+
+    def generate():
+        if file_format == "csv":
+            yield encode_csv(keys, [keys])
+        with db.engine.connect() as connection:
+            result = connection.execution_options(stream_results=True, max_row_buffer=chunk_size).execute(statement)
+            for rows in result.partitions(chunk_size):
+                yield encode(keys, rows)
+
+    def compress(chunks):
+        # wbits=31 writes the gzip header and trailer
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        for chunk in chunks:
+            data = compressor.compress(chunk.encode())
+            if data:
+                yield data
+        yield compressor.flush()
+
+    body = compress(generate()) if gzip else generate()
+    response = Response(stream_with_context(body), mimetype=FORMATS[file_format])
+    response.headers["Vary"] = "Accept-Encoding"
+    if gzip:
+        response.headers["Content-Encoding"] = "gzip"
+    return response
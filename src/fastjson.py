@@ -0,0 +1,33 @@
+import os
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider that encodes and decodes with orjson. Calls with
+    other arguments (like the indent of pretty printing) use the stdlib."""
+
+    def dumps(self, obj, **kwargs):
+        # jsonify() always asks for compact separators, orjson output already is
+        if kwargs.get("separators", None) == (",", ":"):
+            del kwargs["separators"]
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        option = orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=self.default, option=option).decode()
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+def get_json_provider_class():
+    # FAST_JSON=0 forces the stdlib provider
+    if orjson is None or os.getenv("FAST_JSON", "1") == "0":
+        return DefaultJSONProvider
+    return OrjsonProvider
@@ -0,0 +1,121 @@
+from collections import Counter
+from sqlalchemy import func, insert, literal, tuple_
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from models import db, Favorite, FavoriteCount, Character, Planet, Vehicle
+from utils import chunked, insert_ignore
+
+# kind -> (model, column of favorite that points to it)
+KINDS = {
+    "character": (Character, Favorite.character_id),
+    "planet": (Planet, Favorite.planet_id),
+    "vehicle": (Vehicle, Favorite.vehicle_id)
+}
+# Columns of the uq_favorite_items unique index
+KEY_COLUMNS = ("user_id", "character_id", "planet_id", "vehicle_id")
+
+def upsert_counts(counts, add):
+    """Write {(kind, item_id): count} into favorite_count with one executemany.
+    add=True adds the counts to the stored ones, add=False replaces them."""
+    if not counts:
+        return
+    table = FavoriteCount.__table__
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        statement = (postgresql if dialect == "postgresql" else sqlite).insert(table)
+        new_count = statement.excluded["count"]
+        statement = statement.on_conflict_do_update(
+            index_elements=["kind", "item_id"],
+            set_={"count": table.c["count"] + new_count if add else new_count})
+    elif dialect == "mysql":
+        statement = mysql.insert(table)
+        new_count = statement.inserted["count"]
+        statement = statement.on_duplicate_key_update(
+            {"count": table.c["count"] + new_count if add else new_count})
+    else:
+        raise ValueError(f"favorite counts are not supported on {dialect}")
+    db.session.execute(statement, [
+        {"kind": kind, "item_id": item_id, "count": count}
+        for (kind, item_id), count in counts.items()
+    ])
+
+def item_counts(rows, amount):
+    """{(kind, item_id): amount * number of `rows` (dicts with character_id,
+    planet_id and vehicle_id) that point to the item}."""
+    counts = Counter()
+    for values in rows:
+        for kind, (model, column) in KINDS.items():
+            item_id = values.get(column.key, None)
+            if item_id is not None:
+                counts[(kind, item_id)] += amount
+    return counts
+
+def count_favorite(values, amount):
+    """Add `amount` to the counters of the items of one favorite (a dict with
+    character_id, planet_id and vehicle_id). Call it before the commit."""
+    upsert_counts(item_counts([values], amount), add=True)
+
+def favorite_key(values):
+    return tuple(values.get(column, None) for column in KEY_COLUMNS)
+
+def find_favorites(keys):
+    """{key: id} of the stored favorites among `keys` (tuples of
+    KEY_COLUMNS), looked up through the uq_favorite_items index."""
+    index_columns = [Favorite.user_id] + [func.coalesce(getattr(Favorite, column), 0) for column in KEY_COLUMNS[1:]]
+    found = {}
+    for chunk in chunked(keys):
+        wanted = [(key[0],) + tuple(0 if value is None else value for value in key[1:]) for key in chunk]
+        query = db.session.query(Favorite.id, *[getattr(Favorite, column) for column in KEY_COLUMNS]).filter(
+            tuple_(*index_columns).in_(wanted))
+        found.update({tuple(row[1:]): row[0] for row in query})
+    return found
+
+def insert_favorites(rows):
+    """INSERT ... ON CONFLICT DO NOTHING of `rows` (dicts of favorite
+    columns), adding 1 to the counters of the favorites it really inserted.
+    Call it before the commit. Returns (id, inserted) of each row, in order;
+    a favorite already stored, or repeated in `rows`, has inserted=False."""
+    keys = list(dict.fromkeys(favorite_key(row) for row in rows))
+    if db.session.get_bind().dialect.name == "postgresql":
+        # RETURNING lists exactly the rows this statement inserted, even when
+        # another transaction inserts the same favorite at the same time
+        table = Favorite.__table__
+        new = {}
+        for chunk in chunked(keys):
+            statement = postgresql.insert(table).values([dict(zip(KEY_COLUMNS, key)) for key in chunk])
+            statement = statement.on_conflict_do_nothing().returning(table.c.id, *[table.c[column] for column in KEY_COLUMNS])
+            new.update({tuple(row[1:]): row[0] for row in db.session.execute(statement)})
+        ids = find_favorites([key for key in keys if key not in new])
+        ids.update(new)
+    else:
+        # The stored ones are read in the same transaction as the INSERT
+        # (SQLite has a single writer, so nobody inserts in between)
+        ids = find_favorites(keys)
+        new = [key for key in keys if key not in ids]
+        if new:
+            db.session.execute(insert_ignore(Favorite), [dict(zip(KEY_COLUMNS, key)) for key in new])
+            ids.update(find_favorites(new))
+    upsert_counts(item_counts([dict(zip(KEY_COLUMNS, key)) for key in new], 1), add=True)
+
+    results = []
+    seen = set()
+    for row in rows:
+        key = favorite_key(row)
+        results.append((ids.get(key, None), key in new and key not in seen))
+        seen.add(key)
+    return results
+
+def rebuild_favorite_counts():
+    """Recompute every counter from scratch, to repair the table."""
+    FavoriteCount.query.delete(synchronize_session=False)
+    table = FavoriteCount.__table__
+    for kind, (model, column) in KINDS.items():
+        counts = db.session.query(literal(kind), column, func.count()).filter(column.isnot(None)).group_by(column)
+        db.session.execute(insert(table).from_select(["kind", "item_id", "count"], counts))
+    db.session.commit()
+
+def top_favorites(kind, limit):
+    model, column = KINDS[kind]
+    query = db.session.query(model, FavoriteCount.count).join(
+        FavoriteCount, (FavoriteCount.kind == kind) & (FavoriteCount.item_id == model.id)
+    ).filter(FavoriteCount.count > 0).order_by(FavoriteCount.count.desc(), model.id).limit(limit)
+    return [dict(item.serialize(), favorites=count) for item, count in query]
@@ -0,0 +1,258 @@
+import os
+import json
+import time
+import atexit
+import threading
+from bisect import bisect_left
+from flask import request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Upper bounds (seconds) of the latency histogram, the Prometheus defaults
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+class Metrics:
+    """Per-endpoint request latency, status counts, requests in flight and
+    SQL statements/time, rendered in the Prometheus text format. Only plain
+    counters are updated while serving, so the hooks cost a few microseconds.
+
+    With `directory` (several gunicorn workers) a thread in each process
+    saves its numbers to <directory>/<pid>-<start>.json every `interval`
+    seconds, and render() adds up the files of every worker, dead ones
+    included, so the counters never go back when the scrape lands on
+    another worker. Files of dead workers are folded into dead.json."""
+
+    def __init__(self, directory=None, interval=1.0):
+        self.directory = directory
+        self.interval = interval
+        self.path = None
+        self.pid = None
+        self.thread = None
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        # endpoint -> [bucket counts..., +Inf count], sum
+        self.latency = {}
+        self.latency_sum = {}
+        # (endpoint, method, status) -> count
+        self.responses = {}
+        # endpoint -> statements, seconds
+        self.sql_statements = {}
+        self.sql_seconds = {}
+        # SQL of the request being served by this thread
+        self.current = threading.local()
+
+    def init_app(self, app):
+        app.before_request(self.before_request)
+        app.after_request(self.after_request)
+        app.teardown_request(self.teardown_request)
+        # Every engine (also the sync side of the async one)
+        event.listen(Engine, "before_cursor_execute", self.before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", self.after_cursor_execute)
+        if self.directory is not None:
+            atexit.register(self.save)
+
+    def start(self):
+        # Once per process: the thread does not survive the fork of gunicorn --preload
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            # Also when init_app did not run (ENABLE_METRICS=0) and only /metrics is served
+            os.makedirs(self.directory, exist_ok=True)
+            self.path = os.path.join(self.directory, f"{self.pid}-{time.time_ns()}.json")
+            self.thread = threading.Thread(target=self.run, name="metrics-writer", daemon=True)
+            self.thread.start()
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            self.save()
+
+    def before_request(self):
+        if self.directory is not None and self.pid != os.getpid():
+            self.start()
+        current = self.current
+        current.start = time.perf_counter()
+        current.statements = 0
+        current.sql_time = 0.0
+        current.recorded = False
+        with self.lock:
+            self.in_flight += 1
+
+    def after_request(self, response):
+        self.record(response.status_code)
+        return response
+
+    def teardown_request(self, exc):
+        current = self.current
+        if getattr(current, "start", None) is None:
+            return
+        # An unhandled exception skips after_request
+        if not current.recorded:
+            self.record(500)
+        current.start = None
+
+    def record(self, status):
+        current = self.current
+        if getattr(current, "start", None) is None or current.recorded:
+            return
+        current.recorded = True
+        elapsed = time.perf_counter() - current.start
+        # The rule and not the path, so /planets/1 and /planets/2 share the series
+        rule = request.url_rule
+        endpoint = rule.rule if rule is not None else "unmatched"
+        key = (endpoint, request.method, status)
+        with self.lock:
+            self.in_flight -= 1
+            buckets = self.latency.get(endpoint, None)
+            if buckets is None:
+                buckets = self.latency[endpoint] = [0] * (len(BUCKETS) + 1)
+                self.latency_sum[endpoint] = 0.0
+                self.sql_statements[endpoint] = 0
+                self.sql_seconds[endpoint] = 0.0
+            buckets[bisect_left(BUCKETS, elapsed)] += 1
+            self.latency_sum[endpoint] += elapsed
+            self.responses[key] = self.responses.get(key, 0) + 1
+            self.sql_statements[endpoint] += current.statements
+            self.sql_seconds[endpoint] += current.sql_time
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        current = self.current
+        # Statements out of a request (CLI, startup) are not counted
+        if getattr(current, "start", None) is not None:
+            current.statements += 1
+            current.sql_time += elapsed
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "pid": os.getpid(),
+                "in_flight": self.in_flight,
+                "latency": {endpoint: list(buckets) for endpoint, buckets in self.latency.items()},
+                "latency_sum": dict(self.latency_sum),
+                "responses": [[endpoint, method, status, value] for (endpoint, method, status), value in self.responses.items()],
+                "sql_statements": dict(self.sql_statements),
+                "sql_seconds": dict(self.sql_seconds)
+            }
+
+    def save(self):
+        if self.path is None or self.pid != os.getpid():
+            return
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "w") as file:
+            json.dump(self.snapshot(), file)
+        os.replace(temporary, self.path)
+
+    def collect(self):
+        """Sum of the saved numbers of every process."""
+        self.save()
+        total = {"pid": None, "in_flight": 0, "latency": {}, "latency_sum": {}, "responses": [],
+                 "sql_statements": {}, "sql_seconds": {}}
+        try:
+            import fcntl
+        except ImportError:
+            fcntl = None
+        with open(os.path.join(self.directory, "lock"), "a") as lock_file:
+            # Only one worker at a time folds the dead ones
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            dead_path = os.path.join(self.directory, "dead.json")
+            dead = self.read(dead_path)
+            folded = []
+            for name in os.listdir(self.directory):
+                if not name.endswith(".json") or name == "dead.json":
+                    continue
+                state = self.read(os.path.join(self.directory, name))
+                if state is None:
+                    continue
+                if fcntl is not None and not process_alive(state["pid"]):
+                    dead = add_state(dead, dict(state, in_flight=0))
+                    folded.append(name)
+                else:
+                    total = add_state(total, state)
+            if folded:
+                with open(f"{dead_path}.tmp", "w") as file:
+                    json.dump(dead, file)
+                os.replace(f"{dead_path}.tmp", dead_path)
+                for name in folded:
+                    os.remove(os.path.join(self.directory, name))
+        if dead is not None:
+            total = add_state(total, dead)
+        return total
+
+    def read(self, path):
+        try:
+            with open(path) as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
+
+    def render(self):
+        """All the metrics in the Prometheus text exposition format."""
+        if self.directory is not None:
+            if self.pid != os.getpid():
+                self.start()
+            return render_state(self.collect())
+        return render_state(self.snapshot())
+
+def add_state(total, state):
+    """`total` plus `state` (two snapshots), or `state` when total is None."""
+    if total is None:
+        return state
+    total["in_flight"] += state["in_flight"]
+    for endpoint, buckets in state["latency"].items():
+        current = total["latency"].setdefault(endpoint, [0] * len(buckets))
+        total["latency"][endpoint] = [a + b for a, b in zip(current, buckets)]
+    for name in ("latency_sum", "sql_statements", "sql_seconds"):
+        for endpoint, value in state[name].items():
+            total[name][endpoint] = total[name].get(endpoint, 0) + value
+    responses = {(endpoint, method, status): value for endpoint, method, status, value in total["responses"]}
+    for endpoint, method, status, value in state["responses"]:
+        responses[(endpoint, method, status)] = responses.get((endpoint, method, status), 0) + value
+    total["responses"] = [[endpoint, method, status, value] for (endpoint, method, status), value in responses.items()]
+    return total
+
+def render_state(state):
+    lines = []
+    lines.append("# HELP http_requests_in_flight Requests being served.")
+    lines.append("# TYPE http_requests_in_flight gauge")
+    lines.append(f"http_requests_in_flight {state['in_flight']}")
+
+    lines.append("# HELP http_requests_total Responses by endpoint, method and status.")
+    lines.append("# TYPE http_requests_total counter")
+    for endpoint, method, status, value in sorted(state["responses"]):
+        lines.append(f'http_requests_total{{endpoint="{endpoint}",method="{method}",status="{status}"}} {value}')
+
+    lines.append("# HELP http_request_duration_seconds Request latency by endpoint.")
+    lines.append("# TYPE http_request_duration_seconds histogram")
+    for endpoint, buckets in sorted(state["latency"].items()):
+        total = 0
+        for bound, value in zip(BUCKETS + ("+Inf",), buckets):
+            total += value
+            lines.append(f'http_request_duration_seconds_bucket{{endpoint="{endpoint}",le="{bound}"}} {total}')
+        lines.append(f'http_request_duration_seconds_sum{{endpoint="{endpoint}"}} {state["latency_sum"][endpoint]}')
+        lines.append(f'http_request_duration_seconds_count{{endpoint="{endpoint}"}} {total}')
+
+    lines.append("# HELP db_statements_total SQL statements run by the requests of each endpoint.")
+    lines.append("# TYPE db_statements_total counter")
+    for endpoint, value in sorted(state["sql_statements"].items()):
+        lines.append(f'db_statements_total{{endpoint="{endpoint}"}} {value}')
+
+    lines.append("# HELP db_statement_duration_seconds_total Time spent in SQL by the requests of each endpoint.")
+    lines.append("# TYPE db_statement_duration_seconds_total counter")
+    for endpoint, value in sorted(state["sql_seconds"].items()):
+        lines.append(f'db_statement_duration_seconds_total{{endpoint="{endpoint}"}} {value}')
+    return "\n".join(lines) + "\n"
@@ -1,13 +1,24 @@
+import secrets
 from flask_sqlalchemy import SQLAlchemy
 
 db = SQLAlchemy()
 
+#Cambia en cada INSERT/UPDATE de la fila, el cache de fragmentos (cache.py) lo usa para saber si su JSON sigue valido
+#Es un numero al azar y no un contador, asi una fila nueva que reusa el id de una borrada nunca coincide
+def new_row_version():
+    return secrets.randbits(62)
+
+def row_version_column():
+    return db.Column(db.BigInteger, nullable=False, default=new_row_version, onupdate=new_row_version, server_default="0")
+
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(120), unique=True, nullable=False)
     username = db.Column(db.String(12), unique=True, nullable=False)
-    password = db.Column(db.String(80), unique=False, nullable=False)
+    #Hash del password (werkzeug), nunca el texto plano
+    password = db.Column(db.String(255), unique=False, nullable=False)
     is_active = db.Column(db.Boolean(), unique=False, nullable=False)
+    row_version = row_version_column()
 
     def __init__(self, email, password, username):
         self.email = email
@@ -15,6 +26,9 @@ class User(db.Model):
         self.username = username
         self.is_active = True
 
+    #Columnas que nunca salen en /export
+    PRIVATE = ("password",)
+
     def __repr__(self):
         return '<User %r>' % self.username
 
@@ -29,12 +43,13 @@ class User(db.Model):
 class Character(db.Model):
     id = db.Column(db.Integer, primary_key = True)
     name = db.Column(db.String(42), unique=True, nullable=False)
-    height = db.Column(db.Float, nullable=False)
-    weight = db.Column(db.Float, nullable=False)
-    planet_origin_id = db.Column(db.Integer, db.ForeignKey("planet.id"), nullable=True)
+    height = db.Column(db.Float, nullable=False, index=True)
+    weight = db.Column(db.Float, nullable=False, index=True)
+    planet_origin_id = db.Column(db.Integer, db.ForeignKey("planet.id"), nullable=True, index=True)
     planet = db.relationship("Planet")
-    vehicle_id = db.Column(db.Integer, db.ForeignKey("vehicle.id"), nullable=True)
+    vehicle_id = db.Column(db.Integer, db.ForeignKey("vehicle.id"), nullable=True, index=True)
     vehicle = db.relationship("Vehicle")
+    row_version = row_version_column()
 
     def __init__(self, name, height, weight, planet, vehicle):
         self.name = name
@@ -43,15 +58,22 @@ class Character(db.Model):
         self.planet = planet
         self.vehicle = vehicle
 
+    #Relaciones que se pueden incluir con ?expand=
+    EXPANDABLE = ("planet", "vehicle")
+    #Columnas que se pueden usar en los filtros (?height_gt=) y en ?sort=
+    FILTERS = ("name", "height", "weight", "planet_origin_id", "vehicle_id")
+    SORTABLE = ("id", "name", "height", "weight")
+    #Columnas de /stats/characters
+    STATS = ("height", "weight")
 
-    def serialize(self):
+    def serialize(self, expand=()):
         return {
             "id" : self.id,
             "name" : self.name,
             "height" : self.height,
             "weight" : self.weight,
-            "planet" : self.planet_origin_id,
-            "vehicle" : self.vehicle_id
+            "planet" : self.planet.serialize() if "planet" in expand and self.planet else self.planet_origin_id,
+            "vehicle" : self.vehicle.serialize() if "vehicle" in expand and self.vehicle else self.vehicle_id
         }
 
 
@@ -59,10 +81,11 @@ class Planet(db.Model):
     id = db.Column(db.Integer, primary_key = True)
     name = db.Column(db.String(42), unique=True, nullable=False)
     density = db.Column(db.Float, nullable=False)
-    diameter = db.Column(db.Float, nullable=False)
+    diameter = db.Column(db.Float, nullable=False, index=True)
     orbital_period = db.Column(db.Integer, nullable=False)
-    population = db.Column(db.Integer, nullable=False)
+    population = db.Column(db.Integer, nullable=False, index=True)
     weater = db.Column(db.String(42), nullable= False)
+    row_version = row_version_column()
 
     def __init__(self, name, density, diameter, orbital_period, population, weater):
         self.name = name
@@ -72,6 +95,12 @@ class Planet(db.Model):
         self.population = population
         self.weater = weater
 
+    #Columnas que se pueden usar en los filtros (?population_gt=) y en ?sort=
+    FILTERS = ("name", "density", "diameter", "orbital_period", "population", "weater")
+    SORTABLE = ("id", "name", "density", "diameter", "orbital_period", "population")
+    #Columnas de /stats/planets
+    STATS = ("population", "diameter")
+
     def serialize(self):
         return {
             "id" : self.id,
@@ -86,10 +115,11 @@ class Planet(db.Model):
 class Vehicle(db.Model):
     id = db.Column(db.Integer, primary_key = True)
     name = db.Column(db.String(42), unique=True, nullable=False)
-    crew = db.Column(db.Integer, nullable=False)
+    crew = db.Column(db.Integer, nullable=False, index=True)
     model = db.Column(db.String(42), nullable=False)
-    cargo_capacity = db.Column(db.Float, nullable=False)
+    cargo_capacity = db.Column(db.Float, nullable=False, index=True)
     passengers = db.Column(db.Integer, nullable=False)
+    row_version = row_version_column()
 
     def __init__(self, name, crew, model, cargo_capacity, passengers):
         self.name = name
@@ -97,6 +127,12 @@ class Vehicle(db.Model):
         self.model = model
         self.cargo_capacity = cargo_capacity
         self.passengers = passengers
+
+    #Columnas que se pueden usar en los filtros (?crew_lte=) y en ?sort=
+    FILTERS = ("name", "crew", "model", "cargo_capacity", "passengers")
+    SORTABLE = ("id", "name", "crew", "cargo_capacity", "passengers")
+    #Columnas de /stats/vehicles
+    STATS = ("crew", "cargo_capacity")
    
     def serialize(self):
         return {
@@ -111,17 +147,31 @@ class Vehicle(db.Model):
 
 class Favorite(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable = False)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable = False, index = True)
     user = db.relationship("User") #Objeto de python
 
-    character_id = db.Column(db.Integer, db.ForeignKey("character.id"), nullable = True)
+    character_id = db.Column(db.Integer, db.ForeignKey("character.id"), nullable = True, index = True)
     character = db.relationship("Character")
 
-    planet_id = db.Column(db.Integer, db.ForeignKey("planet.id"), nullable = True)
+    planet_id = db.Column(db.Integer, db.ForeignKey("planet.id"), nullable = True, index = True)
     planet = db.relationship("Planet")
 
-    vehicle_id = db.Column(db.Integer, db.ForeignKey("vehicle.id"), nullable = True)
+    vehicle_id = db.Column(db.Integer, db.ForeignKey("vehicle.id"), nullable = True, index = True)
     vehicle = db.relationship("Vehicle")
+    row_version = row_version_column()
+
+    #Un mismo favorito no se puede repetir. Se usa coalesce porque en un
+    #UNIQUE normal los NULL nunca chocan entre ellos
+    __table_args__ = (
+        db.Index(
+            "uq_favorite_items",
+            "user_id",
+            db.func.coalesce(character_id, 0),
+            db.func.coalesce(planet_id, 0),
+            db.func.coalesce(vehicle_id, 0),
+            unique=True
+        ),
+    )
 
     #Cuando es una relacion, se construye a partir del objeto
     def __init__(self, user, character, planet, vehicle):
@@ -130,11 +180,99 @@ class Favorite(db.Model):
         self.planet = planet
         self.vehicle = vehicle
 
-    def serialize(self):
+    #Relaciones que se pueden incluir con ?expand=
+    EXPANDABLE = ("user", "character", "planet", "vehicle")
+    #Columnas que se pueden usar en los filtros (?user_id=) y en ?sort=
+    FILTERS = ("user_id", "character_id", "planet_id", "vehicle_id")
+    SORTABLE = ("id", "user_id")
+
+    def serialize(self, expand=()):
         return {
             "id" : self.id,
-            "user": self.user_id,
-            "character" : self.character_id,
-            "planet" : self.planet_id,
-            "vehicle": self.vehicle_id
+            "user": self.user.serialize() if "user" in expand and self.user else self.user_id,
+            "character" : self.character.serialize() if "character" in expand and self.character else self.character_id,
+            "planet" : self.planet.serialize() if "planet" in expand and self.planet else self.planet_id,
+            "vehicle": self.vehicle.serialize() if "vehicle" in expand and self.vehicle else self.vehicle_id
+        }
+
+    #Incluye el character, planet y vehicle completos en vez de solo el id
+    def serialize_with_items(self):
+        return self.serialize(expand=("character", "planet", "vehicle"))
+
+
+#Version por tabla, se incrementa en cada escritura (se usa para los ETag)
+class TableVersion(db.Model):
+    __tablename__ = "table_version"
+    name = db.Column(db.String(42), primary_key=True)
+    version = db.Column(db.Integer, nullable=False)
+
+    def __init__(self, name, version):
+        self.name = name
+        self.version = version
+
+    def serialize(self):
+        return {
+            "name" : self.name,
+            "version" : self.version
+        }
+
+
+#Tokens revocados antes de expirar (logout), se borran cuando ya expiraron
+class RevokedToken(db.Model):
+    __tablename__ = "revoked_token"
+    jti = db.Column(db.String(32), primary_key=True)
+    expires_at = db.Column(db.Integer, nullable=False, index=True)
+
+    def __init__(self, jti, expires_at):
+        self.jti = jti
+        self.expires_at = expires_at
+
+    def serialize(self):
+        return {
+            "jti" : self.jti,
+            "expires_at" : self.expires_at
+        }
+
+
+#Cuantas veces se marco como favorito cada character, planet o vehicle
+class FavoriteCount(db.Model):
+    __tablename__ = "favorite_count"
+    kind = db.Column(db.String(12), primary_key=True)
+    item_id = db.Column(db.Integer, primary_key=True)
+    count = db.Column(db.Integer, nullable=False)
+
+    __table_args__ = (
+        db.Index("ix_favorite_count_kind_count", "kind", "count"),
+    )
+
+    def __init__(self, kind, item_id, count):
+        self.kind = kind
+        self.item_id = item_id
+        self.count = count
+
+    def serialize(self):
+        return {
+            "kind" : self.kind,
+            "item_id" : self.item_id,
+            "count" : self.count
+        }
+
+
+#Resultado de cada POST/DELETE de favoritos encolado con WRITE_BEHIND, asi cualquier worker responde el ticket
+class FavoriteTicket(db.Model):
+    __tablename__ = "favorite_ticket"
+    ticket = db.Column(db.String(24), primary_key=True)
+    body = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.Integer, nullable=False, index=True)
+
+    def __init__(self, ticket, body, created_at):
+        self.ticket = ticket
+        self.body = body
+        self.created_at = created_at
+
+    def serialize(self):
+        return {
+            "ticket" : self.ticket,
+            "body" : self.body,
+            "created_at" : self.created_at
         }
@@ -0,0 +1,71 @@
+import os
+import json
+import time
+import threading
+from sqlalchemy.pool import QueuePool
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wait_lock = threading.Lock()
+        self.waits = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.timeouts = 0
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        except Exception:
+            with self.wait_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            with self.wait_lock:
+                self.waits += 1
+                self.wait_total += waited
+                self.wait_max = max(self.wait_max, waited)
+
+def get_engine_options(database_uri):
+    """Engine options from the environment. SQLALCHEMY_ENGINE_OPTIONS (JSON)
+    overrides any of the DB_* variables."""
+    options = {
+        "pool_pre_ping": os.getenv("DB_POOL_PRE_PING", "1") in ("1", "true", "True"),
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", 1800))
+    }
+    if not database_uri.startswith("sqlite"):
+        options["poolclass"] = TimedQueuePool
+        options["pool_size"] = int(os.getenv("DB_POOL_SIZE", 5))
+        options["max_overflow"] = int(os.getenv("DB_MAX_OVERFLOW", 5))
+        options["pool_timeout"] = float(os.getenv("DB_POOL_TIMEOUT", 10))
+    statement_timeout = os.getenv("DB_STATEMENT_TIMEOUT", None)
+    if statement_timeout and database_uri.startswith("postgresql"):
+        # Applied to every statement of the connection, so a slow query can
+        # never hold a request (and its pooled connection) longer than this
+        options["connect_args"] = {"options": f"-c statement_timeout={int(statement_timeout)}"}
+    options.update(json.loads(os.getenv("SQLALCHEMY_ENGINE_OPTIONS", "{}")))
+    return options
+
+def get_pool_status(engine):
+    pool = engine.pool
+    status = {"pid": os.getpid(), "pool": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        status.update({
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "idle": pool.checkedin(),
+            "overflow": max(pool.overflow(), 0)
+        })
+    if isinstance(pool, TimedQueuePool):
+        with pool.wait_lock:
+            status.update({
+                "checkouts": pool.waits,
+                "timeouts": pool.timeouts,
+                "wait_avg_ms": round(pool.wait_total / pool.waits * 1000, 3) if pool.waits else 0,
+                "wait_max_ms": round(pool.wait_max * 1000, 3)
+            })
+    return status
@@ -0,0 +1,93 @@
+import re
+from sqlalchemy import event, func, literal, or_, select, text, union_all
+from models import db, Character, Planet, Vehicle
+
+# kind -> model of every searchable table
+SEARCHABLE = {
+    "character": Character,
+    "planet": Planet,
+    "vehicle": Vehicle
+}
+
+def create_search_index(connection):
+    """Create the name index used by /search. Postgres uses pg_trgm GIN
+    indexes, SQLite one FTS5 table per kind (rowid = id of the row) kept in
+    sync by triggers, so every insert/delete/rename updates it in the same
+    transaction."""
+    dialect = connection.dialect.name
+    if dialect == "postgresql":
+        connection.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        for kind in SEARCHABLE:
+            connection.execute(text(
+                f'CREATE INDEX IF NOT EXISTS ix_{kind}_name_trgm ON "{kind}" USING gin (name gin_trgm_ops)'))
+    elif dialect == "sqlite":
+        for kind in SEARCHABLE:
+            connection.execute(text(f"CREATE VIRTUAL TABLE IF NOT EXISTS search_{kind} USING fts5(name)"))
+            connection.execute(text(f"""
+                CREATE TRIGGER IF NOT EXISTS search_{kind}_insert AFTER INSERT ON "{kind}" BEGIN
+                    INSERT INTO search_{kind}(rowid, name) VALUES (new.id, new.name);
+                END"""))
+            connection.execute(text(f"""
+                CREATE TRIGGER IF NOT EXISTS search_{kind}_delete AFTER DELETE ON "{kind}" BEGIN
+                    DELETE FROM search_{kind} WHERE rowid = old.id;
+                END"""))
+            connection.execute(text(f"""
+                CREATE TRIGGER IF NOT EXISTS search_{kind}_update AFTER UPDATE OF name ON "{kind}" BEGIN
+                    UPDATE search_{kind} SET name = new.name WHERE rowid = new.id;
+                END"""))
+            # Rows that already existed before the index
+            connection.execute(text(
+                f'INSERT INTO search_{kind}(rowid, name) SELECT id, name FROM "{kind}" '
+                f'WHERE id NOT IN (SELECT rowid FROM search_{kind})'))
+
+@event.listens_for(db.metadata, "after_create")
+def create_search_index_after_create_all(target, connection, **kw):
+    create_search_index(connection)
+
+def drop_search_index(connection):
+    """Drop the FTS5 tables of SQLite (its triggers and the Postgres indexes
+    go away with their tables)."""
+    if connection.dialect.name == "sqlite":
+        for kind in SEARCHABLE:
+            connection.execute(text(f"DROP TABLE IF EXISTS search_{kind}"))
+
+@event.listens_for(db.metadata, "after_drop")
+def drop_search_index_after_drop_all(target, connection, **kw):
+    drop_search_index(connection)
+
+def fts_query(q):
+    # Every word of q as a quoted prefix term, so user input is never parsed as FTS5 syntax
+    words = re.findall(r"\w+", q)
+    return " ".join(f'"{word}"*' for word in words)
+
+def search(q, kinds, limit):
+    """Best `limit` matches of q in the names of `kinds`, as dicts
+    ({kind, id, name}) ordered from the best match."""
+    dialect = db.session.get_bind().dialect.name
+    if dialect == "sqlite":
+        match = fts_query(q)
+        if not match:
+            return []
+        # rank is the bm25 score of FTS5, lower is better
+        selects = [
+            f"SELECT '{kind}' AS kind, rowid AS id, name, rank AS score FROM search_{kind} WHERE search_{kind} MATCH :match"
+            for kind in kinds
+        ]
+        statement = text(" UNION ALL ".join(selects) + " ORDER BY score LIMIT :limit")
+        rows = db.session.execute(statement, {"match": match, "limit": limit})
+    else:
+        selects = []
+        for kind in kinds:
+            model = SEARCHABLE[kind]
+            if dialect == "postgresql":
+                # % and ILIKE both use the trigram index, higher similarity is better
+                score = -func.similarity(model.name, q)
+                pattern = q.replace("/", "//").replace("%", "/%").replace("_", "/_")
+                condition = or_(model.name.op("%")(q), model.name.ilike(f"%{pattern}%", escape="/"))
+            else:
+                score = func.length(model.name)
+                condition = model.name.startswith(q, autoescape=True)
+            selects.append(select(literal(kind).label("kind"), model.id, model.name, score.label("score")).where(condition))
+        statement = union_all(*selects)
+        rows = db.session.execute(select(statement.subquery()).order_by(text("score")).limit(limit))
+    return [{"kind": row.kind, "id": row.id, "name": row.name} for row in rows]
@@ -0,0 +1,101 @@
+import threading
+from bisect import bisect_right
+from sqlalchemy import func, case
+from models import db
+from utils import get_versions
+
+class StatsCache:
+    """Count, min/max/mean and histogram of the model.STATS columns, computed
+    with SQL aggregates and cached by table version. Single row writes
+    update the cached entry in place; any other change (bulk writes, writes
+    from other workers, a new min/max) makes the next read recompute it."""
+
+    def __init__(self, buckets=10):
+        self.buckets = buckets
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def get(self, model):
+        table = model.__tablename__
+        version, = get_versions([table])
+        with self.lock:
+            entry = self.entries.get(table, None)
+            if entry is not None and entry["version"] == version:
+                return self.to_dict(entry)
+        entry = self.compute(model)
+        entry["version"] = version
+        with self.lock:
+            self.entries[table] = entry
+            return self.to_dict(entry)
+
+    def compute(self, model):
+        columns = {}
+        count = 0
+        for name in model.STATS:
+            column = getattr(model, name)
+            count, minimum, maximum, total = db.session.query(
+                func.count(column), func.min(column), func.max(column), func.sum(column)).one()
+            edges = []
+            counts = [count] if count else []
+            if count and maximum > minimum:
+                width = (maximum - minimum) / self.buckets
+                edges = [minimum + width * i for i in range(1, self.buckets)]
+                # How many rows are below each edge, all in one query
+                below = db.session.query(*[func.sum(case((column < edge, 1), else_=0)) for edge in edges]).one()
+                cumulative = [0] + [value or 0 for value in below] + [count]
+                counts = [cumulative[i + 1] - cumulative[i] for i in range(self.buckets)]
+            columns[name] = {"min": minimum, "max": maximum, "sum": total or 0, "edges": edges, "counts": counts}
+        return {"count": count, "columns": columns}
+
+    def row_added(self, model, row, version):
+        self.apply(model, row, 1, version)
+
+    def row_removed(self, model, row, version):
+        self.apply(model, row, -1, version)
+
+    def apply(self, model, row, sign, version):
+        """Update the cached entry with one written row. Call it after the
+        commit with the table version that commit produced (see
+        utils.committed_version), the entry is only updated when this write
+        is the only change since it was computed."""
+        table = model.__tablename__
+        with self.lock:
+            entry = self.entries.get(table, None)
+            if entry is None:
+                return
+            if version is None or entry["version"] != version - 1 or not self.can_apply(entry, row, sign):
+                del self.entries[table]
+                return
+            entry["count"] += sign
+            for name, column in entry["columns"].items():
+                value = getattr(row, name)
+                column["sum"] += sign * value
+                column["counts"][bisect_right(column["edges"], value)] += sign
+            entry["version"] = version
+
+    def can_apply(self, entry, row, sign):
+        if entry["count"] == 0 or (sign < 0 and entry["count"] == 1):
+            return False
+        for name, column in entry["columns"].items():
+            value = getattr(row, name)
+            # New min/max changes the buckets, removing one needs a new MIN()/MAX()
+            if sign > 0 and not column["min"] <= value <= column["max"]:
+                return False
+            if sign < 0 and value in (column["min"], column["max"]):
+                return False
+        return True
+
+    def to_dict(self, entry):
+        columns = {}
+        for name, column in entry["columns"].items():
+            bounds = [column["min"]] + column["edges"] + [column["max"]]
+            columns[name] = {
+                "min": column["min"],
+                "max": column["max"],
+                "mean": column["sum"] / entry["count"] if entry["count"] else None,
+                "histogram": [
+                    {"from": bounds[i], "to": bounds[i + 1], "count": count}
+                    for i, count in enumerate(column["counts"])
+                ]
+            }
+        return {"count": entry["count"], "columns": columns}
@@ -1,4 +1,13 @@
-from flask import jsonify, url_for
+import base64
+import hashlib
+import json
+from functools import wraps
+from flask import jsonify, url_for, request, current_app, Response, stream_with_context, g
+from sqlalchemy import event, exists, or_, and_, insert
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
+from models import db, TableVersion
 
 class APIException(Exception):
     status_code = 400
@@ -15,13 +24,411 @@ class APIException(Exception):
         rv['message'] = self.message
         return rv
 
+def encode_cursor(values):
+    # Opaque cursor so clients never build it by hand
+    raw = json.dumps(values).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor, size):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except ValueError:
+        raise APIException(f"Invalid cursor: {cursor}", status_code=400)
+    if not isinstance(values, list) or len(values) != size:
+        raise APIException(f"Invalid cursor: {cursor}", status_code=400)
+    return values
+
+def get_page_size():
+    max_size = current_app.config.get('MAX_PAGE_SIZE', 100)
+    limit = request.args.get('limit', None)
+    if limit is None:
+        return max_size
+    try:
+        limit = int(limit)
+    except ValueError:
+        raise APIException(f"Invalid limit: {limit}", status_code=400)
+    if limit < 1:
+        raise APIException("limit must be greater than 0", status_code=400)
+    return min(limit, max_size)
+
+FILTER_OPERATORS = {
+    "gt": lambda column, value: column > value,
+    "gte": lambda column, value: column >= value,
+    "lt": lambda column, value: column < value,
+    "lte": lambda column, value: column <= value,
+    "prefix": lambda column, value: column.startswith(value, autoescape=True)
+}
+# Query parameters that are not filters
+RESERVED_ARGS = ('limit', 'after', 'stream', 'expand', 'sort', 'ids')
+
+def apply_filters(query, model):
+    """Turn ?<column>=, ?<column>_gt=, _gte, _lt, _lte and _prefix into a SQL
+    WHERE. Only the columns listed in model.FILTERS are accepted."""
+    allowed = getattr(model, 'FILTERS', ())
+    for arg, value in request.args.items():
+        if arg in RESERVED_ARGS:
+            continue
+        name, operator = arg, None
+        if '_' in arg and arg.rsplit('_', 1)[1] in FILTER_OPERATORS:
+            name, operator = arg.rsplit('_', 1)
+        if name not in allowed:
+            raise APIException(f"Unknown filter: {arg}", status_code=400)
+        column = getattr(model, name)
+        python_type = column.type.python_type
+        if operator == "prefix" and python_type is not str:
+            raise APIException(f"{arg} only works on text columns", status_code=400)
+        try:
+            value = python_type(value)
+        except ValueError:
+            raise APIException(f"Invalid value for {arg}: {value}", status_code=400)
+        if operator is None:
+            query = query.filter(column == value)
+        else:
+            query = query.filter(FILTER_OPERATORS[operator](column, value))
+    return query
+
+def get_sort(model):
+    """Parse ?sort=<column> or ?sort=-<column> (descending) against
+    model.SORTABLE. Returns (column, descending)."""
+    sort = request.args.get('sort', None)
+    if not sort:
+        return model.id, False
+    descending = sort.startswith('-')
+    name = sort.lstrip('-')
+    if name not in getattr(model, 'SORTABLE', ()):
+        raise APIException(f"Cannot sort by: {name}", status_code=400)
+    return getattr(model, name), descending
+
+def sort_order(model, sort):
+    column, descending = sort
+    if column is model.id:
+        return [model.id.desc() if descending else model.id]
+    # id breaks the ties so every row has a unique position for the cursor
+    if descending:
+        return [column.desc(), model.id.desc()]
+    return [column, model.id]
+
+def sort_key(sort):
+    column, descending = sort
+    return ("-" if descending else "") + column.key
+
+def cursor_value(column, value, cursor):
+    """`value` of a cursor checked against the python type of `column`."""
+    python_type = column.type.python_type
+    if python_type is float and type(value) is int:
+        value = float(value)
+    if type(value) is not python_type:
+        raise APIException(f"Invalid cursor: {cursor}", status_code=400)
+    return value
+
+def cursor_position(cursor, model, sort):
+    """(sort value, id) of the last row of the previous page. The cursor
+    must come from a page with the same ?sort=."""
+    column, descending = sort
+    key, value, last_id = decode_cursor(cursor, 3)
+    if key != sort_key(sort):
+        raise APIException(f"This cursor is for sort={key}, it cannot be used with sort={sort_key(sort)}", status_code=400)
+    return cursor_value(column, value, cursor), cursor_value(model.id, last_id, cursor)
+
+def paginate(query, model):
+    """Keyset pagination (?limit=&after=) ordered by ?sort= and then by
+    primary key, so every page costs the same no matter how deep it is.
+    Returns the rows of the page and the cursor for the next one (or None)."""
+    limit = get_page_size()
+    column, descending = sort = get_sort(model)
+    after = request.args.get('after', None)
+    if after is not None:
+        value, last_id = cursor_position(after, model, sort)
+        if descending:
+            query = query.filter(or_(column < value, and_(column == value, model.id < last_id)))
+        else:
+            query = query.filter(or_(column > value, and_(column == value, model.id > last_id)))
+    # Fetch one extra row to know if there is a next page
+    rows = query.order_by(*sort_order(model, sort)).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        # The cursor keeps its sort, so it is never compared with another column
+        next_cursor = encode_cursor([sort_key(sort), getattr(rows[-1], column.key), rows[-1].id])
+    return rows, next_cursor
+
+def wants_stream():
+    return request.args.get('stream', '0').lower() in ('1', 'true', 'yes')
+
+def get_expand(model):
+    """Parse ?expand=a,b and check the names against model.EXPANDABLE."""
+    expand = request.args.get('expand', None)
+    if not expand:
+        return ()
+    names = tuple(name.strip() for name in expand.split(',') if name.strip())
+    invalid = [name for name in names if name not in getattr(model, 'EXPANDABLE', ())]
+    if invalid:
+        raise APIException(f"Cannot expand: {', '.join(invalid)}", status_code=400)
+    return names
+
+def expand_options(model, expand):
+    # Many-to-one relations, a JOIN keeps the whole page in a single query
+    return [joinedload(getattr(model, name)) for name in expand]
+
+def encode_rows(rows, model, expand=()):
+    """JSON strings of the serialized rows. Plain rows go through the
+    fragment cache (app.extensions['fragment_cache']) when the app has one."""
+    dumps = current_app.json.dumps
+    if expand:
+        return [dumps(row.serialize(expand=expand)) for row in rows]
+    fragment_cache = current_app.extensions.get('fragment_cache', None)
+    if fragment_cache is None:
+        return [dumps(row.serialize()) for row in rows]
+    return fragment_cache.encode(model.__tablename__, rows, dumps)
+
+def page_response(rows, next_cursor, model, expand=()):
+    """Same body as jsonify({"next": ..., "results": [...]}) built by joining
+    the already encoded rows."""
+    body = '{"next":' + current_app.json.dumps(next_cursor) + ',"results":[' + ",".join(encode_rows(rows, model, expand)) + ']}'
+    return Response(body, mimetype='application/json')
+
+def stream_json(query, model, chunk_size=1000, expand=()):
+    """Stream the whole table as a JSON array, reading rows from a
+    server-side cursor so memory does not grow with the table size."""
+    order = sort_order(model, get_sort(model))
+    rows = query.order_by(*order).execution_options(stream_results=True).yield_per(chunk_size)
+
+    def generate():
+        yield "["
+        chunk = []
+        separator = ""
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) == chunk_size:
+                yield separator + ",".join(encode_rows(chunk, model, expand))
+                separator = ","
+                chunk = []
+        if chunk:
+            yield separator + ",".join(encode_rows(chunk, model, expand))
+        yield "]"
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
+def get_bulk_items():
+    items = request.json
+    if not isinstance(items, list) or len(items) == 0:
+        raise APIException("Body must be a non empty array", status_code=400)
+    max_size = current_app.config.get('MAX_BULK_SIZE', 50000)
+    if len(items) > max_size:
+        raise APIException(f"Too many items, the maximum is {max_size}", status_code=400)
+    return items
+
+def missing_fields(item, fields):
+    if not isinstance(item, dict):
+        return list(fields)
+    return [field for field in fields if item.get(field, None) is None]
+
+def chunked(values, size=500):
+    # Keeps IN lists under the bind parameter limit of the database
+    values = list(values)
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+def find_existing(column, values):
+    """Return the subset of `values` already stored in `column`."""
+    values = {value for value in values if value is not None}
+    found = set()
+    for chunk in chunked(values):
+        found.update(row[0] for row in db.session.query(column).filter(column.in_(chunk)))
+    return found
+
+def insert_ignore(model):
+    """INSERT that skips rows violating a unique constraint instead of failing."""
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        return postgresql.insert(model.__table__).on_conflict_do_nothing()
+    if dialect == 'sqlite':
+        return sqlite.insert(model.__table__).on_conflict_do_nothing()
+    if dialect == 'mysql':
+        return insert(model.__table__).prefix_with('IGNORE')
+    raise APIException(f"insert_ignore is not supported on {dialect}", status_code=500)
+
+def bulk_insert(model, rows, errors, insert_rows=None):
+    """Insert `rows` ({index: column values}) with a single executemany in one
+    transaction and build the per item results together with `errors`.
+    insert_rows(values) replaces the executemany for tables where an item
+    may already be stored, it runs in the same transaction and returns
+    (id, inserted) for each row. The items that were already stored are
+    reported as "exists" with the id of the stored row."""
+    outcomes = {}
+    if rows:
+        try:
+            if insert_rows is not None:
+                outcomes = dict(zip(rows, insert_rows(list(rows.values()))))
+            else:
+                db.session.execute(model.__table__.insert(), list(rows.values()))
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            raise APIException("Something went wrong! Nothing was inserted", status_code=500)
+
+    if rows and insert_rows is None:
+        # The executemany does not return the ids, the names are unique
+        ids = {}
+        if hasattr(model, 'name'):
+            for chunk in chunked([values['name'] for values in rows.values()]):
+                ids.update({name: id for id, name in db.session.query(model.id, model.name).filter(model.name.in_(chunk))})
+        outcomes = {index: (ids.get(values.get('name'), None), True) for index, values in rows.items()}
+
+    results = []
+    for index in sorted(list(rows) + list(errors)):
+        if index in errors:
+            results.append({"index": index, "status": "error", "error": errors[index]})
+        else:
+            id, inserted = outcomes[index]
+            results.append({"index": index, "status": "created" if inserted else "exists", "id": id})
+
+    if not errors:
+        status_code = 201
+    elif rows:
+        status_code = 207
+    else:
+        status_code = 400
+    created = sum(1 for id, inserted in outcomes.values() if inserted)
+    return jsonify({"created": created, "failed": len(errors), "results": results}), status_code
+
+def bump_version(table):
+    """Increment the version of `table` and return the new one. It runs from
+    the before_commit hook below, in the same transaction as the write."""
+    updated = TableVersion.query.filter_by(name=table).update(
+        {TableVersion.version: TableVersion.version + 1}, synchronize_session=False)
+    if updated == 0:
+        db.session.add(TableVersion(name=table, version=1))
+        return 1
+    # The row is locked by the UPDATE until the commit, so this is our version
+    return db.session.query(TableVersion.version).filter_by(name=table).scalar()
+
+# Bookkeeping tables, written together with the versioned ones
+UNVERSIONED_TABLES = ("table_version", "favorite_count", "revoked_token", "favorite_ticket")
+
+def changed_tables(session):
+    return session.info.setdefault("changed_tables", set())
+
+@event.listens_for(db.session, "before_flush")
+def track_flushed_tables(session, flush_context, instances):
+    # ORM writes: the views, the admin, anything that uses db.session.add/delete
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        changed_tables(session).add(obj.__table__.name)
+
+@event.listens_for(db.session, "do_orm_execute")
+def track_executed_tables(orm_execute_state):
+    # INSERT/UPDATE/DELETE statements: bulk inserts, query.delete(), ...
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        changed_tables(orm_execute_state.session).add(orm_execute_state.statement.table.name)
+
+@event.listens_for(db.session, "before_commit")
+def bump_changed_versions(session):
+    # The pending objects are flushed first so before_flush sees them
+    session.flush()
+    tables = session.info.pop("changed_tables", set())
+    # Always in the same order, two transactions never wait on each other's rows
+    session.info["versions"] = {table: bump_version(table) for table in sorted(tables.difference(UNVERSIONED_TABLES))}
+
+@event.listens_for(db.session, "after_commit")
+@event.listens_for(db.session, "after_rollback")
+def forget_changed_tables(session):
+    session.info.pop("changed_tables", None)
+
+@event.listens_for(db.session, "after_rollback")
+def forget_versions(session):
+    session.info.pop("versions", None)
+
+def committed_version(table):
+    """Version of `table` produced by the last commit of db.session, None if
+    that commit did not change the table."""
+    return db.session.info.get("versions", {}).get(table, None)
+
+def get_versions(tables):
+    rows = TableVersion.query.filter(TableVersion.name.in_(tables)).all()
+    versions = {row.name: row.version for row in rows}
+    return [versions.get(table, 0) for table in tables]
+
+def make_etag(versions, full_path):
+    key = f"{versions}|{full_path}"
+    return hashlib.sha1(key.encode()).hexdigest()
+
+def conditional(*tables):
+    """Send a strong ETag built from the versions of `tables` and the request
+    URL, and answer 304 without running the view when the client has it."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            versions = get_versions(tables)
+            # Kept for the view, so it does not have to read them again
+            g.table_versions = dict(zip(tables, versions))
+            etag = make_etag(versions, request.full_path)
+            if request.if_none_match.contains(etag):
+                response = Response(status=304)
+                response.set_etag(etag)
+                return response
+            response = current_app.make_response(view(*args, **kwargs))
+            if response.status_code == 200:
+                response.set_etag(etag)
+            return response
+        return wrapper
+    return decorator
+
+def get_ids():
+    """Parse ?ids=1,2,3 into a list of unique ints (keeping the order)."""
+    ids = request.args.get('ids', None)
+    if not ids:
+        raise APIException("Missing ids", status_code=400)
+    try:
+        ids = list(dict.fromkeys(int(id) for id in ids.split(',') if id.strip()))
+    except ValueError:
+        raise APIException(f"Invalid ids: {request.args['ids']}", status_code=400)
+    max_size = current_app.config.get('MAX_BULK_SIZE', 50000)
+    if len(ids) > max_size:
+        raise APIException(f"Too many ids, the maximum is {max_size}", status_code=400)
+    return ids
+
+def batch_delete(model, ids, references, blocked_error):
+    """Delete every id in `ids` that is not used by any of the `references`
+    columns. The lookup marks each row as free or blocked with an EXISTS,
+    and the DELETE of the free ones repeats the NOT EXISTS, so a reference
+    added in between keeps the row. Returns the deleted ids and the per id
+    results."""
+    blocked_by = or_(*[exists().where(column == model.id) for column in references])
+    status = {}
+    for chunk in chunked(ids):
+        for id, blocked in db.session.query(model.id, blocked_by).filter(model.id.in_(chunk)):
+            status[id] = "blocked" if blocked else "deleted"
+
+    free = [id for id in ids if status.get(id) == "deleted"]
+    if free:
+        removed = 0
+        for chunk in chunked(free):
+            removed += model.query.filter(model.id.in_(chunk), ~blocked_by).delete(synchronize_session=False)
+        if removed != len(free):
+            # Something changed since the lookup, the rows still there got a reference
+            for id in find_existing(model.id, free):
+                status[id] = "blocked"
+        db.session.commit()
+
+    results = []
+    for id in ids:
+        if id not in status:
+            results.append({"id": id, "status": "error", "error": f"{model.__name__} with id: {id} not found"})
+        elif status[id] == "blocked":
+            results.append({"id": id, "status": "error", "error": blocked_error})
+        else:
+            results.append({"id": id, "status": "deleted"})
+    deleted = [id for id in ids if status.get(id) == "deleted"]
+    return deleted, results
+
 def has_no_empty_params(rule):
     defaults = rule.defaults if rule.defaults is not None else ()
     arguments = rule.arguments if rule.arguments is not None else ()
     return len(defaults) >= len(arguments)
 
 def generate_sitemap(app):
-    links = ['/admin/']
+    links = ['/admin/'] if 'admin' in app.blueprints else []
     for rule in app.url_map.iter_rules():
         # Filter out rules we can't navigate to in a browser
         # and rules that require parameters
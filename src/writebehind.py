@@ -0,0 +1,213 @@
+import os
+import json
+import time
+import atexit
+import secrets
+import threading
+from collections import Counter
+from models import db, User, Character, Planet, Vehicle, Favorite, FavoriteTicket
+from utils import find_existing
+from leaderboard import KINDS, insert_favorites, upsert_counts
+
+class FavoriteWriter:
+    """Write-behind queue for favorite creates and deletes. Requests only
+    queue the change and get a ticket; a background thread writes the queue
+    in one transaction when it has `max_batch` changes or the oldest one
+    waited `interval` seconds. close() (at exit, or from the gunicorn
+    worker_exit hook) writes whatever is left.
+
+    The result of each ticket is saved in the favorite_ticket table in the
+    same transaction as the batch, so any worker can answer a poll. They
+    are kept `ticket_ttl` seconds."""
+
+    def __init__(self, app, max_batch=500, interval=0.05, ticket_ttl=3600, pending_ttl=60):
+        self.app = app
+        self.max_batch = max_batch
+        self.interval = interval
+        self.ticket_ttl = ticket_ttl
+        self.pending_ttl = pending_ttl
+        self.queue = []
+        self.condition = threading.Condition()
+        self.thread = None
+        self.pid = None
+        self.closed = False
+        self.batches = 0
+        self.written = 0
+        self.retries = 0
+        atexit.register(self.close)
+
+    def start(self):
+        # The thread is started on first use, and again in a forked worker
+        # (threads do not survive the fork of gunicorn --preload)
+        if self.thread is None or self.pid != os.getpid():
+            self.pid = os.getpid()
+            self.closed = False
+            self.thread = threading.Thread(target=self.run, name="favorite-writer", daemon=True)
+            self.thread.start()
+
+    def submit(self, action, values):
+        """Queue a "create" (favorite columns) or a "delete" ({"id", "owner"})
+        and return its ticket id."""
+        # The ticket starts with the time it was issued (hex seconds)
+        ticket = f"{int(time.time()):08x}{secrets.token_hex(8)}"
+        with self.condition:
+            self.start()
+            self.queue.append((ticket, action, values, time.monotonic()))
+            # The first change starts the timer, a full batch is written now
+            if len(self.queue) == 1 or len(self.queue) >= self.max_batch:
+                self.condition.notify()
+        return ticket
+
+    def get_ticket(self, ticket):
+        """Result of `ticket`, {"status": "pending"} while its batch is not
+        written (for at most `pending_ttl` seconds), None if it is unknown."""
+        row = db.session.get(FavoriteTicket, ticket)
+        if row is not None:
+            return json.loads(row.body)
+        try:
+            issued_at = int(ticket[:8], 16)
+        except ValueError:
+            return None
+        if len(ticket) == 24 and 0 <= time.time() - issued_at < self.pending_ttl:
+            return {"status": "pending"}
+        return None
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.closed and (not self.queue or (
+                        len(self.queue) < self.max_batch and time.monotonic() - self.queue[0][3] < self.interval)):
+                    timeout = self.interval - (time.monotonic() - self.queue[0][3]) if self.queue else None
+                    self.condition.wait(timeout)
+                if self.closed and not self.queue:
+                    return
+                batch, self.queue = self.queue[:self.max_batch], self.queue[self.max_batch:]
+            self.flush(batch)
+
+    def close(self):
+        """Write everything queued and stop the thread."""
+        with self.condition:
+            if self.thread is None or self.pid != os.getpid():
+                return
+            self.closed = True
+            self.condition.notify()
+        self.thread.join()
+        self.thread = None
+
+    def flush(self, batch):
+        with self.app.app_context():
+            self.write(batch)
+        with self.condition:
+            self.batches += 1
+            self.written += len(batch)
+
+    def write(self, batch):
+        """Write `batch` and its tickets in one transaction. When it fails it
+        is split in halves that are written again, so a bad change only
+        fails its own ticket and the rest are still saved."""
+        results = {}
+        try:
+            # Runs of the same action keep the order of the requests
+            start = 0
+            for end in range(1, len(batch) + 1):
+                if end == len(batch) or batch[end][1] != batch[start][1]:
+                    run = batch[start:end]
+                    if run[0][1] == "create":
+                        self.create(run, results)
+                    else:
+                        self.delete(run, results)
+                    start = end
+            self.save_tickets(batch, results)
+            db.session.commit()
+            return
+        except Exception as error:
+            db.session.rollback()
+            failure = error
+        if len(batch) > 1:
+            self.app.logger.warning("Write-behind batch of %s favorites failed, retrying in halves: %s", len(batch), failure)
+            with self.condition:
+                self.retries += 1
+            half = len(batch) // 2
+            self.write(batch[:half])
+            self.write(batch[half:])
+            return
+        self.app.logger.error("Write-behind change of ticket %s failed", batch[0][0], exc_info=failure)
+        results = {batch[0][0]: {"status": "error", "code": 500, "error": str(failure)}}
+        try:
+            self.save_tickets(batch, results)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            self.app.logger.exception("Could not save the result of ticket %s", batch[0][0])
+
+    def save_tickets(self, batch, results):
+        now = int(time.time())
+        # The old ones are not needed anymore
+        FavoriteTicket.query.filter(FavoriteTicket.created_at < now - self.ticket_ttl).delete(synchronize_session=False)
+        db.session.execute(FavoriteTicket.__table__.insert(), [
+            {"ticket": ticket, "body": json.dumps(dict(results[ticket], action=action)), "created_at": now}
+            for ticket, action, values, queued_at in batch
+        ])
+
+    def create(self, run, results):
+        """INSERT ... ON CONFLICT DO NOTHING of every valid favorite of the
+        run (leaderboard.insert_favorites), validated with one IN query per
+        table."""
+        rows = [values for ticket, action, values, queued_at in run]
+        found = {
+            "user_id": find_existing(User.id, [row["user_id"] for row in rows]),
+            "character_id": find_existing(Character.id, [row["character_id"] for row in rows]),
+            "planet_id": find_existing(Planet.id, [row["planet_id"] for row in rows]),
+            "vehicle_id": find_existing(Vehicle.id, [row["vehicle_id"] for row in rows])
+        }
+        valid = []
+        for ticket, action, values, queued_at in run:
+            not_found = [f"{column[:-3].capitalize()} with id: {values[column]} not found"
+                         for column in found if values[column] is not None and values[column] not in found[column]]
+            if not_found:
+                results[ticket] = {"status": "error", "code": 404, "error": " or ".join(not_found)}
+            else:
+                valid.append((ticket, values))
+        if not valid:
+            return
+
+        for (ticket, values), (favorite_id, inserted) in zip(valid, insert_favorites([values for ticket, values in valid])):
+            # Same body as the synchronous POST /favorites
+            results[ticket] = {"status": "done", "code": 200, "favorite": {
+                "id": favorite_id, "user": values["user_id"], "character": values["character_id"],
+                "planet": values["planet_id"], "vehicle": values["vehicle_id"]}}
+
+    def delete(self, run, results):
+        """DELETE ... WHERE id IN (...) of the run, with the counters of the
+        leaderboard updated in one statement."""
+        ids = {values["id"] for ticket, action, values, queued_at in run}
+        rows = {row.id: row for row in Favorite.query.filter(Favorite.id.in_(ids))}
+        deleted = set()
+        counts = Counter()
+        for ticket, action, values, queued_at in run:
+            row = rows.get(values["id"], None)
+            if row is None or row.id in deleted:
+                results[ticket] = {"status": "error", "code": 404, "error": f"Favorite with id: {values['id']} not found"}
+            elif values["owner"] is not None and values["owner"] != row.user_id:
+                results[ticket] = {"status": "error", "code": 403, "error": "You can only change your own favorites"}
+            else:
+                deleted.add(row.id)
+                for kind, (model, column) in KINDS.items():
+                    item_id = getattr(row, column.key)
+                    if item_id is not None:
+                        counts[(kind, item_id)] -= 1
+                results[ticket] = {"status": "done", "code": 202, "favorite": row.serialize()}
+        if deleted:
+            Favorite.query.filter(Favorite.id.in_(deleted)).delete(synchronize_session=False)
+            upsert_counts(counts, add=True)
+
+    def stats(self):
+        with self.condition:
+            return {
+                "queued": len(self.queue),
+                "batches": self.batches,
+                "written": self.written,
+                "retries": self.retries,
+                "max_batch": self.max_batch,
+                "interval": self.interval
+            }
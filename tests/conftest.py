@@ -0,0 +1,26 @@
+import os
+import sys
+import tempfile
+import pytest
+
+# The app reads its settings when it is imported
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test.db')}"
+os.environ["ENABLE_ADMIN"] = "0"
+os.environ["FLASK_APP_KEY"] = "test key"
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from app import app as flask_app
+from models import db
+
+@pytest.fixture
+def app():
+    with flask_app.app_context():
+        db.create_all()
+        yield flask_app
+        db.session.remove()
+        db.drop_all()
+    flask_app.extensions["revoked_tokens"].loaded_at = None
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
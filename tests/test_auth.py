@@ -0,0 +1,100 @@
+import os
+import sys
+import json
+import time
+import subprocess
+import auth
+from auth import issue_token, verify_token, sign, b64encode, hash_password
+from models import db, User
+
+def make_token(claims):
+    payload = b64encode(json.dumps(claims).encode())
+    return f"{payload}.{sign(payload)}"
+
+def test_valid_token(app):
+    token, claims = issue_token(7)
+    assert verify_token(token) == claims
+
+def test_forged_signature(app):
+    token, claims = issue_token(7)
+    payload, _, signature = token.partition(".")
+    # Another user id with the old signature
+    forged = b64encode(json.dumps(dict(claims, sub=1)).encode())
+    assert verify_token(f"{forged}.{signature}") is None
+    # Signed with another key
+    app.config["SECRET_KEY"], key = "another key", app.config["SECRET_KEY"]
+    other, _ = issue_token(7)
+    app.config["SECRET_KEY"] = key
+    assert verify_token(other) is None
+
+def test_expired(app):
+    token, claims = issue_token(7, ttl=-1)
+    assert verify_token(token) is None
+
+def test_revoked(app):
+    token, claims = issue_token(7)
+    app.extensions["revoked_tokens"].revoke(claims)
+    db.session.commit()
+    assert verify_token(token) is None
+    # Other workers see it when they reload the list from the table
+    app.extensions["revoked_tokens"].revoked = {}
+    app.extensions["revoked_tokens"].reload()
+    assert verify_token(token) is None
+
+def test_malformed(app):
+    future = int(time.time()) + 60
+    assert verify_token("") is None
+    assert verify_token("no-signature") is None
+    assert verify_token("a.b.c") is None
+    # Correctly signed, but the payload is not what issue_token makes
+    payload = "not base64 json!"
+    assert verify_token(f"{payload}.{sign(payload)}") is None
+    assert verify_token(make_token([1, 2])) is None
+    assert verify_token(make_token({"sub": 7, "exp": "tomorrow", "jti": "x"})) is None
+    assert verify_token(make_token({"exp": future, "jti": "x"})) is None
+
+def test_login(client):
+    db.session.add(User(email="luke@example.com", username="luke", password=hash_password("secret")))
+    db.session.commit()
+    response = client.post("/login", json={"username": "luke", "password": "secret"})
+    assert response.status_code == 200
+    token = response.json["token"]
+    assert client.get("/me", headers={"Authorization": f"Bearer {token}"}).json["id"] == response.json["user"]["id"]
+    assert client.post("/logout", headers={"Authorization": f"Bearer {token}"}).status_code == 200
+    assert client.get("/me", headers={"Authorization": f"Bearer {token}"}).status_code == 401
+
+def test_login_checks_a_hash_for_unknown_users(client, monkeypatch):
+    checked = []
+    real_check = auth.check_password_hash
+    monkeypatch.setattr(auth, "check_password_hash", lambda stored, password: checked.append(stored) or real_check(stored, password))
+    response = client.post("/login", json={"username": "nobody", "password": "secret"})
+    assert response.status_code == 401
+    assert checked == [auth.get_dummy_hash()]
+
+def test_login_rejects_non_strings(client):
+    for body in ({"username": "luke", "password": 123}, {"username": ["luke"], "password": "secret"},
+                 {"email": {"a": 1}, "password": "secret"}, ["luke", "secret"]):
+        response = client.post("/login", json=body)
+        assert response.status_code == 400
+        assert response.is_json
+
+def test_admin_does_not_replace_the_key(tmp_path):
+    # The app reads its settings when it is imported, so it is loaded again
+    # in another process, with the admin on and without FLASK_APP_KEY
+    script = """
+import json, time
+from app import app, db
+from auth import b64encode
+import hmac, hashlib
+with app.app_context():
+    db.create_all()
+payload = b64encode(json.dumps({"sub": 1, "exp": int(time.time()) + 60, "jti": "x"}).encode())
+signature = b64encode(hmac.new(b"sample key", payload.encode(), hashlib.sha256).digest())
+response = app.test_client().get("/me", headers={"Authorization": f"Bearer {payload}.{signature}"})
+print(response.status_code)
+"""
+    env = dict(os.environ, ENABLE_ADMIN="1", DATABASE_URL=f"sqlite:///{tmp_path / 'test.db'}")
+    env.pop("FLASK_APP_KEY")
+    src = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+    result = subprocess.run([sys.executable, "-c", script], cwd=src, env=env, capture_output=True, text=True, check=True)
+    assert result.stdout.split()[-1] == "401"
@@ -0,0 +1,69 @@
+import io
+import json
+from catalog import JSONStream, CatalogImporter, read_records
+from models import Planet, Vehicle, Character
+
+PLANETS = [
+    {"name": "Tatooine", "density": 3.5, "diameter": 10465, "orbital_period": 304, "population": 200000, "weater": "arid"},
+    {"name": "Hoth", "density": -1.25e-3, "diameter": 7200, "orbital_period": 549, "population": 0, "weater": "frozen"}
+]
+VEHICLES = [{"name": "Sand Crawler", "cargo_capacity": 50000, "crew": 46, "model": "Digger Crawler", "passengers": 30}]
+CHARACTERS = [{"name": "Luke", "height": 172.5, "weight": 77, "planet": "Tatooine", "vehicle": "Sand Crawler"}]
+
+def typed(kind, records):
+    return [dict(record, type=kind) for record in records]
+
+def write_formats(tmp_path, extra=()):
+    """The same records in the three formats. `extra` are records without
+    a kind (not objects) added to the formats that can hold them."""
+    records = typed("planet", PLANETS) + typed("vehicle", VEHICLES) + typed("character", CHARACTERS)
+    paths = {}
+    paths["ndjson"] = tmp_path / "catalog.ndjson"
+    paths["ndjson"].write_text("\n".join(json.dumps(record) for record in records + list(extra)) + "\n")
+    paths["array"] = tmp_path / "array.json"
+    paths["array"].write_text(json.dumps(records + list(extra), indent=1))
+    paths["object"] = tmp_path / "object.json"
+    paths["object"].write_text(json.dumps({"planets": PLANETS + list(extra), "vehicles": VEHICLES, "people": CHARACTERS}))
+    return paths
+
+def test_read_records_with_tiny_chunks(tmp_path):
+    paths = write_formats(tmp_path)
+    expected = ([("planet", record) for record in PLANETS] + [("vehicle", record) for record in VEHICLES]
+                + [("character", record) for record in CHARACTERS])
+    for name, path in paths.items():
+        file_format = "ndjson" if name == "ndjson" else "json"
+        for chunk_size in (1, 2, 3, 7, 64):
+            records = [(kind, {key: value for key, value in record.items() if key != "type"})
+                       for kind, record in read_records(str(path), file_format, chunk_size)]
+            assert records == expected, (name, chunk_size)
+
+def test_numbers_across_chunks():
+    # Every split of each number falls on a chunk boundary with some chunk size
+    document = '[3.5, -12, 1e3, 2.5E-2, 10, 0, true, null, "7"]'
+    for chunk_size in range(1, len(document) + 1):
+        stream = JSONStream(io.StringIO(document), chunk_size)
+        assert list(stream.items()) == [3.5, -12, 1000.0, 0.025, 10, 0, True, None, "7"], chunk_size
+
+def test_buffer_does_not_hold_the_file():
+    document = json.dumps({"planets": [dict(PLANETS[0], name=f"planet {i}") for i in range(2000)], "vehicles": []})
+    stream = JSONStream(io.StringIO(document), chunk_size=256)
+    largest = 0
+    stream.expect("{")
+    while stream.peek() != "}":
+        stream.value()
+        stream.expect(":")
+        for record in stream.items():
+            largest = max(largest, len(stream.buffer))
+        if stream.peek() == ",":
+            stream.pos += 1
+    assert largest < 1024
+
+def test_import_skips_records_that_are_not_objects(app, tmp_path):
+    for name, path in write_formats(tmp_path, extra=[42, ["a list"], "text"]).items():
+        messages = []
+        errors = CatalogImporter(str(path), chunk_size=1, log=messages.append).run()
+        assert errors == 3, name
+        assert sum("not an object" in message for message in messages) == 3
+        assert sorted(planet.name for planet in Planet.query) == ["Hoth", "Tatooine"]
+        assert Vehicle.query.count() == 1
+        assert Character.query.one().planet.name == "Tatooine"
@@ -0,0 +1,15 @@
+import os
+from metrics import Metrics
+
+def test_render_creates_the_directory(tmp_path):
+    # gunicorn.conf.py sets METRICS_DIR, also when init_app never runs
+    directory = tmp_path / "api-metrics"
+    metrics = Metrics(directory=str(directory), interval=60)
+    text = metrics.render()
+    assert "http_requests_in_flight 0" in text
+    assert os.path.exists(metrics.path)
+
+def test_metrics_endpoint_without_directory(client):
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.content_type.startswith("text/plain")
@@ -0,0 +1,52 @@
+import pytest
+from models import db, Planet
+from utils import encode_cursor
+
+@pytest.fixture
+def planets(client):
+    # Only 4 diameters, so most rows tie and the id decides their order
+    db.session.execute(Planet.__table__.insert(), [
+        {"name": f"planet {i}", "density": 1, "diameter": (i % 4) * 1000, "orbital_period": 1,
+         "population": i * 10, "weater": "arid"}
+        for i in range(23)
+    ])
+    db.session.commit()
+    return client
+
+def walk(client, query):
+    ids = []
+    url = f"/planets?limit=3&{query}"
+    while url is not None:
+        response = client.get(url)
+        assert response.status_code == 200
+        ids += [planet["id"] for planet in response.json["results"]]
+        cursor = response.json["next"]
+        url = f"/planets?limit=3&{query}&after={cursor}" if cursor is not None else None
+    return ids
+
+def test_walk_every_page_with_ties(planets):
+    rows = db.session.query(Planet.id, Planet.diameter).all()
+    descending = [id for id, diameter in sorted(rows, key=lambda row: (-row[1], -row[0]))]
+    ascending = [id for id, diameter in sorted(rows, key=lambda row: (row[1], row[0]))]
+    assert walk(planets, "sort=-diameter") == descending
+    assert walk(planets, "sort=diameter") == ascending
+    assert walk(planets, "") == sorted(id for id, diameter in rows)
+
+def test_cursor_of_another_sort(planets):
+    cursor = planets.get("/planets?limit=3&sort=-diameter").json["next"]
+    for sort in ("diameter", "population", "-population"):
+        response = planets.get(f"/planets?limit=3&sort={sort}&after={cursor}")
+        assert response.status_code == 400
+        assert "sort=-diameter" in response.json["message"]
+    # Nor a cursor of the default order (by id) with a sort
+    cursor = planets.get("/planets?limit=3").json["next"]
+    assert planets.get(f"/planets?limit=3&sort=-diameter&after={cursor}").status_code == 400
+
+def test_crafted_cursors(planets):
+    for values in (["-diameter", 1000.0, "5"], ["-diameter", 1000.0, 5.5], ["-diameter", 1000.0, True],
+                   ["-diameter", "1000", 5], ["-diameter", None, 5], ["-diameter", 1000.0], "not a list"):
+        response = planets.get(f"/planets?limit=3&sort=-diameter&after={encode_cursor(values)}")
+        assert response.status_code == 400, values
+    assert planets.get("/planets?limit=3&sort=-diameter&after=%%%").status_code == 400
+    # A whole number is a valid value of a float column
+    assert planets.get(f"/planets?limit=3&sort=-diameter&after={encode_cursor(['-diameter', 1000, 5])}").status_code == 200
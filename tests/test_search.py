@@ -0,0 +1,12 @@
+from models import db, Planet
+
+def test_drop_all_drops_the_index(app):
+    db.session.add(Planet(name="Tatooine", density=1, diameter=1, orbital_period=1, population=1, weater="arid"))
+    db.session.commit()
+    db.session.remove()
+    db.drop_all()
+    db.create_all()
+    # The index starts empty again, so the new row 1 does not collide with the old one
+    db.session.add(Planet(name="Hoth", density=1, diameter=1, orbital_period=1, population=1, weater="frozen"))
+    db.session.commit()
+    assert app.test_client().get("/search?q=hoth").json["results"][0]["name"] == "Hoth"
@@ -0,0 +1,61 @@
+import pytest
+from app import stats_cache
+from models import db, Planet
+
+def planet(name, population, diameter):
+    return {"name": name, "density": 1, "diameter": diameter, "orbital_period": 100,
+            "population": population, "weater": "arid"}
+
+@pytest.fixture
+def planets(client):
+    # Entries are cached by table version, which starts again in every test
+    stats_cache.entries.clear()
+    for i, (population, diameter) in enumerate([(0, 1000), (50, 2000), (120, 2500), (400, 4000), (1000, 9000)]):
+        assert client.post("/planets", json=planet(f"planet {i}", population, diameter)).status_code == 201
+    assert client.get("/stats/planets").status_code == 200
+    return client
+
+def fresh_stats():
+    return stats_cache.to_dict(stats_cache.compute(Planet))
+
+def test_add_inside_the_range_updates_in_place(planets):
+    entry = stats_cache.entries["planet"]
+    # 400 is an edge of the population buckets: it goes to the bucket on its right
+    for i, (population, diameter) in enumerate([(400, 3000), (1, 8999), (999, 1001)]):
+        assert planets.post("/planets", json=planet(f"new {i}", population, diameter)).status_code == 201
+        assert stats_cache.entries["planet"] is entry
+        assert planets.get("/stats/planets").json == fresh_stats()
+
+def test_add_outside_the_range_recomputes(planets):
+    assert planets.post("/planets", json=planet("bigger", 5000, 500)).status_code == 201
+    assert "planet" not in stats_cache.entries
+    stats = planets.get("/stats/planets").json
+    assert stats == fresh_stats()
+    assert stats["count"] == 6
+    assert stats["columns"]["population"]["max"] == 5000
+    assert stats["columns"]["diameter"]["min"] == 500
+
+def test_delete_inside_the_range_updates_in_place(planets):
+    entry = stats_cache.entries["planet"]
+    id = Planet.query.filter_by(name="planet 2").one().id
+    assert planets.delete(f"/planets/{id}").status_code == 202
+    assert stats_cache.entries["planet"] is entry
+    stats = planets.get("/stats/planets").json
+    assert stats == fresh_stats()
+    assert stats["count"] == 4
+
+def test_delete_of_the_min_or_max_recomputes(planets):
+    for name in ("planet 0", "planet 4"):
+        id = Planet.query.filter_by(name=name).one().id
+        assert planets.delete(f"/planets/{id}").status_code == 202
+        assert "planet" not in stats_cache.entries
+        assert planets.get("/stats/planets").json == fresh_stats()
+    assert planets.get("/stats/planets").json["columns"]["population"]["max"] == 400
+
+def test_other_writes_recompute(planets):
+    # A write the cache did not see (another worker, a bulk insert) skips a version
+    db.session.add(Planet(name="hidden", density=1, diameter=3000, orbital_period=1, population=100, weater="arid"))
+    db.session.commit()
+    assert planets.post("/planets", json=planet("seen", 200, 3000)).status_code == 201
+    assert "planet" not in stats_cache.entries
+    assert planets.get("/stats/planets").json["count"] == 7
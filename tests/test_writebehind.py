@@ -0,0 +1,49 @@
+import time
+from collections import Counter
+import pytest
+from models import db, User, Planet, Favorite, FavoriteCount
+from leaderboard import insert_favorites
+from writebehind import FavoriteWriter
+
+def favorite(user_id, planet_id):
+    return {"user_id": user_id, "character_id": None, "planet_id": planet_id, "vehicle_id": None}
+
+@pytest.fixture
+def writer(app):
+    db.session.add(User(email="luke@example.com", username="luke", password="secret"))
+    db.session.execute(Planet.__table__.insert(), [
+        {"name": f"planet {i}", "density": 1, "diameter": 1, "orbital_period": 1, "population": 1, "weater": "arid"}
+        for i in range(8)
+    ])
+    db.session.commit()
+    return FavoriteWriter(app)
+
+def batch(changes):
+    # What the queue holds: (ticket, action, values, queued_at)
+    return [(f"{int(time.time()):08x}{index:016x}", action, values, time.monotonic())
+            for index, (action, values) in enumerate(changes)]
+
+def test_one_bad_change_only_fails_its_ticket(writer):
+    (existing_id, inserted), = insert_favorites([favorite(1, 8)])
+    db.session.commit()
+    changes = [("create", favorite(1, planet_id)) for planet_id in (1, 2, 3)]
+    # An unhashable id breaks the IN query of the whole batch
+    changes.append(("create", favorite([1], 4)))
+    changes += [("create", favorite(1, 5)), ("create", favorite(1, 2)), ("delete", {"id": existing_id, "owner": 1}),
+                ("create", favorite(1, 99))]
+    tickets = batch(changes)
+    writer.flush(tickets)
+
+    results = [writer.get_ticket(ticket) for ticket, action, values, queued_at in tickets]
+    assert [result["status"] for result in results] == ["done", "done", "done", "error", "done", "done", "done", "error"]
+    assert results[3]["code"] == 500
+    assert results[7]["code"] == 404
+    # The same favorite twice is created once
+    assert results[5]["favorite"]["id"] == results[1]["favorite"]["id"]
+    assert results[6]["favorite"]["planet"] == 8
+    assert writer.stats()["retries"] > 0
+
+    assert sorted(planet_id for planet_id, in db.session.query(Favorite.planet_id)) == [1, 2, 3, 5]
+    counts = {item_id: count for item_id, count in
+              db.session.query(FavoriteCount.item_id, FavoriteCount.count).filter_by(kind="planet") if count}
+    assert counts == Counter(planet_id for planet_id, in db.session.query(Favorite.planet_id))